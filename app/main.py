@@ -1,15 +1,18 @@
 import streamlit as st
 import os
 import json
+import asyncio
+import hashlib
 import pandas as pd
 from dotenv import load_dotenv
 
 # Import core functionalities
 from core.ocr_engine import extract_text_from_document
 from core.llm_client import get_llm_response
-from core.prompt_manager import get_prompt_template
+from core.prompt_manager import get_prompt_template, fill_prompt
 from core.data_transformer import transform_llm_output_to_dataframe
 from core.pdf_generator import create_pdf_summary_weasyprint
+from core.document_parser import detect_doc_type, analyze_text_in_chunks, analyze_streaming, MAX_INPUT_TOKENS
 
 # Load environment variables from .env file
 load_dotenv()
@@ -38,6 +41,30 @@ if 'raw_text' not in st.session_state:
 if 'extracted_data' not in st.session_state:
     st.session_state['extracted_data'] = {}
 
+# --- Cached Processing ---
+# Streamlit reruns the whole script on every widget interaction, so OCR and LLM results
+# are memoized by content hash. Parameters prefixed with '_' are excluded from the cache key.
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_ocr(file_hash: str, _file_path: str) -> str:
+    """Extracts text once per unique file content (identified by `file_hash`)."""
+    return extract_text_from_document(_file_path)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_llm(system_instruction: str, prompt: str, provider: str, api_key_hash: str, _api_key: str) -> dict:
+    """Sends a prompt to the LLM once per unique (instruction, prompt, provider, API key) combination."""
+    return get_llm_response(prompt, api_key=_api_key, provider=provider,
+                            system_instruction=system_instruction, parse=True)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_chunked_llm(raw_text: str, doc_type: str, provider: str, api_key_hash: str, _api_key: str) -> dict:
+    """Analyzes an over-long document in chunks once per unique text."""
+    return analyze_text_in_chunks(raw_text, doc_type, _api_key, provider)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_transform(extracted_data: dict):
+    """Transforms the LLM's parsed output for display once per unique output."""
+    return transform_llm_output_to_dataframe(extracted_data)
+
 # --- Sidebar for API Key Input ---
 with st.sidebar:
     st.title("⚙️ Configuration")
@@ -62,7 +89,8 @@ with st.sidebar:
         st.session_state['llm_provider'] = None
 
     st.markdown("---")
-    st.info("Upload your document, then click 'Extract Text' and 'Analyze with LLM' to see the magic!")
+    st.info("Upload your document, then click 'Extract Text' and 'Analyze with LLM' to see the magic! "
+            "You can also click 'Analyze with LLM' directly to extract and analyze in one pass.")
 
 # --- Main Content Area ---
 st.title("📄 Document Analysis Using LLMs")
@@ -74,15 +102,27 @@ if uploaded_file is not None:
     # Save the file temporarily
     temp_file_path = os.path.join("data", "raw", uploaded_file.name)
     os.makedirs(os.path.dirname(temp_file_path), exist_ok=True) # Ensure directory exists
+    # Stream the upload to disk in 1 MiB chunks instead of materializing it in one buffer,
+    # hashing each chunk on the way. The content hash (not the file name) keys the OCR
+    # cache, so identical re-uploads hit.
+    hasher = hashlib.blake2b(digest_size=16)
+    uploaded_file.seek(0)
     with open(temp_file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+        while chunk := uploaded_file.read(1024 * 1024):
+            hasher.update(chunk)
+            f.write(chunk)
     st.session_state['file_path'] = temp_file_path
-    st.success(f"File '{uploaded_file.name}' uploaded successfully!")
+    st.session_state['file_hash'] = hasher.hexdigest()
+    file_name = uploaded_file.name
+    file_type = uploaded_file.type
+    # Everything below works from the copy on disk; drop our reference to the in-memory upload
+    uploaded_file = None
+    st.success(f"File '{file_name}' uploaded successfully!")
 
     # Display document preview if possible (for images)
-    if uploaded_file.type in ["image/png", "image/jpeg"]:
-        st.image(uploaded_file, caption="Uploaded Document Preview", use_column_width=True)
-    elif uploaded_file.type == "application/pdf":
+    if file_type in ["image/png", "image/jpeg"]:
+        st.image(temp_file_path, caption="Uploaded Document Preview", use_column_width=True)
+    elif file_type == "application/pdf":
         st.info("PDF preview is not directly supported in Streamlit for local files. Text will be extracted.")
 
     st.markdown("---")
@@ -91,14 +131,17 @@ if uploaded_file is not None:
         if st.session_state['file_path']:
             with st.spinner("Extracting text using OCR... This may take a moment for large documents."):
                 try:
-                    st.session_state['raw_text'] = extract_text_from_document(st.session_state['file_path'])
+                    st.session_state['raw_text'] = cached_ocr(st.session_state['file_hash'], st.session_state['file_path'])
                     st.success("Text extraction complete!")
                 except Exception as e:
                     st.error(f"Error during text extraction: {e}")
                     st.session_state['raw_text'] = ""
             
             if st.session_state['raw_text']:
-                st.expander("View Raw Extracted Text").code(st.session_state['raw_text'][:2000] + "...", language="text")
+                with st.expander("View Raw Extracted Text"):
+                    raw_text = st.session_state['raw_text']
+                    # Preview only the first 2000 characters; mark the cut only when there is one
+                    st.code(f"{raw_text[:2000]}…" if len(raw_text) > 2000 else raw_text, language="text")
             else:
                 st.warning("No text could be extracted from the document.")
         else:
@@ -107,45 +150,74 @@ if uploaded_file is not None:
     st.markdown("---")
     st.subheader("2. Analyze Document with LLM")
     if st.button("Analyze with LLM", key="analyze_llm_button"):
-        if st.session_state['raw_text'] and st.session_state['llm_api_key']:
-            with st.spinner("Sending document to LLM for analysis..."):
-                try:
-                    # Simple heuristic to guess document type for prompt selection
-                    doc_type = "general"
-                    raw_text_lower = st.session_state['raw_text'].lower()
-                    if "invoice" in raw_text_lower or "bill" in raw_text_lower:
-                        doc_type = "invoice"
-                    elif "contract" in raw_text_lower or "agreement" in raw_text_lower or "terms and conditions" in raw_text_lower:
-                        doc_type = "contract"
-                    elif "form" in raw_text_lower or "application" in raw_text_lower:
-                        doc_type = "form"
-
-                    prompt = get_prompt_template(doc_type, st.session_state['raw_text'])
-                    
-                    llm_output_json_str = get_llm_response(
-                        prompt,
-                        api_key=st.session_state['llm_api_key'],
-                        provider=st.session_state['llm_provider']
-                    )
-                    
-                    st.session_state['extracted_data'] = json.loads(llm_output_json_str)
-                    st.success("LLM analysis complete!")
-                except json.JSONDecodeError:
-                    st.error("LLM did not return valid JSON. Please check the prompt or raw text.")
-                    st.code(llm_output_json_str) # Show raw LLM output for debugging
-                    st.session_state['extracted_data'] = {}
-                except Exception as e:
-                    st.error(f"Error during LLM analysis: {e}")
-                    st.session_state['extracted_data'] = {}
+        if st.session_state['llm_api_key']:
+            if st.session_state['raw_text']:
+                with st.spinner("Sending document to LLM for analysis..."):
+                    try:
+                        # Simple heuristic to guess document type for prompt selection
+                        doc_type = detect_doc_type(st.session_state['raw_text'])
+
+                        api_key_hash = hashlib.blake2b(st.session_state['llm_api_key'].encode(), digest_size=16).hexdigest()
+                        if len(st.session_state['raw_text']) // 4 > MAX_INPUT_TOKENS:
+                            # Too long for a single request: analyze in chunks and merge the results
+                            st.session_state['extracted_data'] = cached_chunked_llm(
+                                st.session_state['raw_text'],
+                                doc_type,
+                                st.session_state['llm_provider'],
+                                api_key_hash,
+                                st.session_state['llm_api_key']
+                            )
+                        else:
+                            system_instruction, user_template = get_prompt_template(doc_type)
+                            prompt = fill_prompt(user_template, st.session_state['raw_text'])
+                            st.session_state['extracted_data'] = cached_llm(
+                                system_instruction,
+                                prompt,
+                                st.session_state['llm_provider'],
+                                api_key_hash,
+                                st.session_state['llm_api_key']
+                            )
+                        
+                        st.success("LLM analysis complete!")
+                    except json.JSONDecodeError as e: # Also catches orjson.JSONDecodeError (a subclass)
+                        st.error("LLM did not return valid JSON. Please check the prompt or raw text.")
+                        st.code(e.doc) # Show raw LLM output for debugging
+                        st.session_state['extracted_data'] = {}
+                    except Exception as e:
+                        st.error(f"Error during LLM analysis: {e}")
+                        st.session_state['extracted_data'] = {}
+            else:
+                # Text has not been extracted yet: run OCR and the LLM in one pass. Only documents
+                # over the input token budget have chunks sent to the LLM while later pages are OCR'd
+                with st.spinner("Extracting text and analyzing with LLM..."):
+                    try:
+                        results = asyncio.run(analyze_streaming(
+                            st.session_state['file_path'],
+                            st.session_state['llm_api_key'],
+                            st.session_state['llm_provider']
+                        ))
+                        st.session_state['raw_text'] = results["raw_text"]
+                        st.session_state['extracted_data'] = results["extracted_data"]
+                        if st.session_state['extracted_data']:
+                            st.success("Text extraction and LLM analysis complete!")
+                    except json.JSONDecodeError as e: # Also catches orjson.JSONDecodeError (a subclass)
+                        st.error("LLM did not return valid JSON. Please check the prompt or raw text.")
+                        st.code(e.doc) # Show raw LLM output for debugging
+                        st.session_state['extracted_data'] = {}
+                    except Exception as e:
+                        st.error(f"Error during text extraction or LLM analysis: {e}")
+                        st.session_state['extracted_data'] = {}
             
             if st.session_state['extracted_data']:
                 st.subheader("Extracted Information:")
                 # Display extracted data in a user-friendly way
-                transformed_df, main_fields, item_df, summary_content = transform_llm_output_to_dataframe(st.session_state['extracted_data'])
+                main_fields, item_df, summary_content = cached_transform(st.session_state['extracted_data'])
                 
                 if main_fields:
                     st.write("### Key Data")
-                    st.table(pd.DataFrame([main_fields]).T.rename(columns={0: 'Value'}))
+                    # Build the one-column frame directly (no transpose/rename); st.dataframe
+                    # serializes via Arrow and scrolls instead of rendering every row as HTML
+                    st.dataframe(pd.DataFrame({'Value': main_fields}), use_container_width=True)
                 
                 if not item_df.empty:
                     st.write("### Line Items")
@@ -156,9 +228,7 @@ if uploaded_file is not None:
                     st.markdown(summary_content)
             else:
                 st.warning("No structured data could be extracted by the LLM.")
-        elif not st.session_state['raw_text']:
-            st.warning("Please extract text from a document first.")
-        elif not st.session_state['llm_api_key']:
+        else:
             st.error("API key is not configured. Please set it in the sidebar or environment variables.")
 
     st.markdown("---")
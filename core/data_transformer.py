@@ -1,7 +1,6 @@
 import pandas as pd
-import json
 
-def transform_llm_output_to_dataframe(extracted_data: dict) -> tuple[pd.DataFrame, dict, pd.DataFrame, str]:
+def transform_llm_output_to_dataframe(extracted_data: dict) -> tuple[dict, pd.DataFrame, str]:
     """
     Transforms the raw dictionary output from the LLM into a more structured format
     suitable for display in Streamlit, including main fields, itemized data, and summary.
@@ -10,8 +9,7 @@ def transform_llm_output_to_dataframe(extracted_data: dict) -> tuple[pd.DataFram
         extracted_data (dict): The dictionary parsed from the LLM's JSON output.
 
     Returns:
-        tuple[pd.DataFrame, dict, pd.DataFrame, str]:
-            - A DataFrame containing all extracted key-value pairs.
+        tuple[dict, pd.DataFrame, str]:
             - A dictionary of main fields (excluding 'items' and summaries).
             - A DataFrame of itemized data (e.g., invoice line items), empty if not present.
             - A string containing the overall summary.
@@ -42,22 +40,7 @@ def transform_llm_output_to_dataframe(extracted_data: dict) -> tuple[pd.DataFram
         else:
             main_fields[key] = value
 
-    # Create a DataFrame for all key-value pairs (excluding items for simplicity in this DF)
-    # This DataFrame is mostly for internal consistency or if you want to display everything flat
-    all_data_for_df = {k: v for k, v in extracted_data.items() if k != 'items'}
-    # Flatten nested lists/dicts within all_data_for_df if they are not items
-    for key, value in all_data_for_df.items():
-        if isinstance(value, list):
-            all_data_for_df[key] = ", ".join(map(str, value))
-        elif isinstance(value, dict):
-            all_data_for_df[key] = json.dumps(value)
-
-    # Create a single DataFrame from all extracted data (excluding items, as they get their own DF)
-    # This DataFrame is more for a conceptual "all data" view.
-    # For display, `main_fields` and `item_df` are more practical.
-    full_df = pd.DataFrame([all_data_for_df])
-
-    return full_df, main_fields, item_df, summary_content
+    return main_fields, item_df, summary_content
 
 if __name__ == '__main__':
     # Example usage
@@ -86,26 +69,22 @@ if __name__ == '__main__':
     }
 
     print("--- Transforming Invoice Data ---")
-    full_df_invoice, main_fields_invoice, item_df_invoice, summary_invoice = transform_llm_output_to_dataframe(sample_invoice_data)
+    main_fields_invoice, item_df_invoice, summary_invoice = transform_llm_output_to_dataframe(sample_invoice_data)
     print("\nMain Fields (Invoice):")
     print(main_fields_invoice)
     print("\nItem DataFrame (Invoice):")
     print(item_df_invoice)
     print("\nSummary (Invoice):")
     print(summary_invoice)
-    print("\nFull DataFrame (Invoice - conceptual):")
-    print(full_df_invoice)
 
     print("\n--- Transforming Contract Data ---")
-    full_df_contract, main_fields_contract, item_df_contract, summary_contract = transform_llm_output_to_dataframe(sample_contract_data)
+    main_fields_contract, item_df_contract, summary_contract = transform_llm_output_to_dataframe(sample_contract_data)
     print("\nMain Fields (Contract):")
     print(main_fields_contract)
     print("\nItem DataFrame (Contract - should be empty):")
     print(item_df_contract)
     print("\nSummary (Contract):")
     print(summary_contract)
-    print("\nFull DataFrame (Contract - conceptual):")
-    print(full_df_contract)
 
     sample_general_data = {
         "document_main_topic": "AI Development",
@@ -114,12 +93,10 @@ if __name__ == '__main__':
         "overall_summary": "This document discusses the rapid advancements in AI, focusing on the capabilities of Large Language Models and the importance of ethical considerations in their development and deployment."
     }
     print("\n--- Transforming General Document Data ---")
-    full_df_general, main_fields_general, item_df_general, summary_general = transform_llm_output_to_dataframe(sample_general_data)
+    main_fields_general, item_df_general, summary_general = transform_llm_output_to_dataframe(sample_general_data)
     print("\nMain Fields (General):")
     print(main_fields_general)
     print("\nItem DataFrame (General - should be empty):")
     print(item_df_general)
     print("\nSummary (General):")
-    print(summary_general)
-    print("\nFull DataFrame (General - conceptual):")
-    print(full_df_general)
\ No newline at end of file
+    print(summary_general)
\ No newline at end of file
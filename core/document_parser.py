@@ -1,10 +1,129 @@
 import os
+import re
 import json
-from core.ocr_engine import extract_text_from_document
-from core.llm_client import get_llm_response
-from core.prompt_manager import get_prompt_template
+import asyncio
+from core.ocr_engine import extract_text_from_document, iter_page_texts
+from core.llm_client import get_llm_response, get_llm_responses, parse_llm_json
+from core.prompt_manager import get_prompt_template, fill_prompt
 from core.data_transformer import transform_llm_output_to_dataframe
 
+# Documents estimated above this many input tokens (~4 characters per token) are split
+# into chunks that are analyzed in parallel and merged, instead of sent in one request
+MAX_INPUT_TOKENS = 120_000
+_CHUNK_CHARS = 30_000
+
+# Keywords used to guess the document type, matched case-insensitively in a single pass;
+# the name of the group that matched is the document type
+_DOC_TYPE_RE = re.compile(
+    r"(?P<invoice>invoice|bill)|(?P<contract>contract|agreement|terms and conditions)|(?P<form>form|application)",
+    re.IGNORECASE
+)
+# When keywords for several types appear, the lowest rank wins
+_DOC_TYPE_PRIORITY = {"invoice": 0, "contract": 1, "form": 2}
+
+def detect_doc_type(raw_text: str) -> str:
+    """
+    Guesses the document type from keywords in the text, for prompt selection.
+
+    Args:
+        raw_text (str): The raw text extracted from the document.
+
+    Returns:
+        str: One of 'invoice', 'contract', 'form' or 'general'.
+    """
+    doc_type = "general"
+    for match in _DOC_TYPE_RE.finditer(raw_text):
+        matched_type = match.lastgroup
+        if doc_type == "general" or _DOC_TYPE_PRIORITY[matched_type] < _DOC_TYPE_PRIORITY[doc_type]:
+            doc_type = matched_type
+            if doc_type == "invoice": # Highest priority, no need to scan further
+                break
+    return doc_type
+
+def _split_text(raw_text: str, max_chars: int = _CHUNK_CHARS) -> list[str]:
+    """Splits text into chunks of at most `max_chars`, breaking on blank lines (page boundaries) where possible."""
+    chunks = []
+    current = []
+    current_len = 0
+    for block in raw_text.split("\n\n"):
+        # A single block larger than a chunk is cut at fixed offsets
+        pieces = [block[i:i + max_chars] for i in range(0, len(block), max_chars)] or [""]
+        for piece in pieces:
+            if current and current_len + len(piece) + 2 > max_chars:
+                chunks.append("\n\n".join(current))
+                current = []
+                current_len = 0
+            current.append(piece)
+            current_len += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def _merge_extractions(partials: list[dict]) -> dict:
+    """Merges per-chunk LLM extractions: 'items' lists are concatenated, other fields keep the first non-empty value."""
+    empty = (None, "", [], {})
+    merged = {}
+    for partial in partials:
+        for key, value in partial.items():
+            if key == 'items':
+                # Chunks without line items may report them as null; treat anything but a list as none
+                merged['items'] = (merged.get('items') or []) + (value if isinstance(value, list) else [])
+            elif key not in merged or (merged[key] in empty and value not in empty):
+                merged[key] = value
+    return merged
+
+def analyze_text_in_chunks(raw_text: str, doc_type: str, llm_api_key: str, llm_provider: str) -> dict:
+    """
+    Extracts structured data from a document too long to send to the LLM in one request.
+
+    The text is split into chunks of at most 30k characters, every chunk is sent with a
+    "partial extraction" prompt in one batched LLM call, and the results are merged.
+
+    Args:
+        raw_text (str): The raw text extracted from the document.
+        doc_type (str): The document type used to select the prompt.
+        llm_api_key (str): API key for the LLM service.
+        llm_provider (str): The LLM provider to use ('openai' or 'gemini').
+
+    Returns:
+        dict: The merged extracted data.
+    """
+    chunks = _split_text(raw_text)
+    system_instruction, user_template = get_prompt_template(doc_type, partial=True)
+    prompts = [fill_prompt(user_template, chunk) for chunk in chunks]
+    partials = get_llm_responses(prompts, llm_api_key, llm_provider,
+                                 system_instructions=[system_instruction] * len(prompts), parse=True)
+    return _merge_extractions(partials)
+
+def _extract_data(raw_text: str, doc_type: str, llm_api_key: str, llm_provider: str) -> dict:
+    """Sends the document text to the LLM in one request, or in chunks if it is too long, and returns the parsed JSON."""
+    if len(raw_text) // 4 > MAX_INPUT_TOKENS:
+        # Too long for a single request: analyze in chunks and merge the results
+        return analyze_text_in_chunks(raw_text, doc_type, llm_api_key, llm_provider)
+    system_instruction, user_template = get_prompt_template(doc_type)
+    prompt = fill_prompt(user_template, raw_text)
+    return get_llm_response(prompt, llm_api_key, llm_provider,
+                            system_instruction=system_instruction, parse=True)
+
+def _empty_results() -> dict:
+    """Returns the results dictionary of a document that has not been (successfully) analyzed."""
+    return {
+        "raw_text": "",
+        "extracted_data": {},
+        "main_fields": None,
+        "item_df": None,
+        "summary_text": ""
+    }
+
+def _apply_extraction(results: dict, extracted_data: dict) -> None:
+    """Stores the LLM's extracted data in `results`, along with its transformation for display."""
+    # Transform first, so a failed transformation leaves `results` untouched
+    main_fields, item_df, summary_content = transform_llm_output_to_dataframe(extracted_data)
+    results["extracted_data"] = extracted_data
+    results["main_fields"] = main_fields
+    results["item_df"] = item_df
+    results["summary_text"] = summary_content
+
 def analyze_document_pipeline(
     file_path: str,
     llm_api_key: str,
@@ -22,13 +141,7 @@ def analyze_document_pipeline(
         dict: A dictionary containing the raw text, extracted data, and processed dataframes.
               Returns an empty dictionary if any step fails.
     """
-    results = {
-        "raw_text": "",
-        "extracted_data": {},
-        "main_fields_df": None,
-        "item_df": None,
-        "summary_text": ""
-    }
+    results = _empty_results()
 
     try:
         # 1. OCR to extract raw text
@@ -43,40 +156,295 @@ def analyze_document_pipeline(
 
         # 2. Determine document type and get LLM prompt
         # Simple heuristic to guess document type for prompt selection
-        doc_type = "general"
-        raw_text_lower = raw_text.lower()
-        if "invoice" in raw_text_lower or "bill" in raw_text_lower:
-            doc_type = "invoice"
-        elif "contract" in raw_text_lower or "agreement" in raw_text_lower or "terms and conditions" in raw_text_lower:
-            doc_type = "contract"
-        elif "form" in raw_text_lower or "application" in raw_text_lower:
-            doc_type = "form"
-        
-        prompt = get_prompt_template(doc_type, raw_text)
+        doc_type = detect_doc_type(raw_text)
+
         print(f"Sending document to LLM ({llm_provider}) for analysis with '{doc_type}' prompt...")
 
         # 3. Use LLM to extract and summarize key entities
-        llm_output_json_str = get_llm_response(prompt, llm_api_key, llm_provider)
-        
-        extracted_data = json.loads(llm_output_json_str)
-        results["extracted_data"] = extracted_data
+        extracted_data = _extract_data(raw_text, doc_type, llm_api_key, llm_provider)
         print("LLM analysis complete.")
 
         # 4. Transform LLM output for display
-        _, main_fields, item_df, summary_content = transform_llm_output_to_dataframe(extracted_data)
-        results["main_fields"] = main_fields
-        results["item_df"] = item_df
-        results["summary_text"] = summary_content
+        _apply_extraction(results, extracted_data)
         print("Data transformation complete.")
 
-    except json.JSONDecodeError as e:
+    except json.JSONDecodeError as e: # Also catches orjson.JSONDecodeError (a subclass)
         print(f"Error: LLM did not return valid JSON: {e}")
-        print(f"LLM Raw Output:\n{llm_output_json_str}")
+        print(f"LLM Raw Output:\n{e.doc}")
     except Exception as e:
         print(f"An error occurred during the document analysis pipeline: {e}")
 
     return results
 
+def analyze_documents_pipeline(
+    file_paths: list[str],
+    llm_api_key: str,
+    llm_provider: str = "openai"
+) -> list[dict]:
+    """
+    Executes the analysis pipeline for several documents at once: the documents are
+    OCR'd one after another and all prompts are sent to the LLM in one batched call.
+
+    Args:
+        file_paths (list[str]): Paths to the input documents (PDF, JPG, PNG).
+        llm_api_key (str): API key for the LLM service.
+        llm_provider (str): The LLM provider to use ('openai' or 'gemini').
+
+    Returns:
+        list[dict]: One results dictionary per document, in the same order as `file_paths`,
+                    with the same keys as `analyze_document_pipeline` returns.
+    """
+    all_results = [_empty_results() for _ in file_paths]
+
+    # 1. OCR the documents one at a time; each document's scanned pages are already spread
+    # over the shared OCR process pool, so OCR'ing documents in parallel would only oversubscribe it
+    print(f"Starting OCR for {len(file_paths)} documents...")
+    for file_path, results in zip(file_paths, all_results):
+        try:
+            results["raw_text"] = extract_text_from_document(file_path)
+        except Exception as e:
+            print(f"An error occurred during OCR of {file_path}: {e}")
+    print("OCR complete.")
+
+    # 2. Build one prompt per document that yielded text; documents too long for a
+    # single request are analyzed in chunks on their own
+    pending = []
+    for i, results in enumerate(all_results):
+        raw_text = results["raw_text"]
+        if not raw_text.strip():
+            continue
+        if len(raw_text) // 4 <= MAX_INPUT_TOKENS:
+            pending.append(i)
+            continue
+        try:
+            extracted_data = analyze_text_in_chunks(raw_text, detect_doc_type(raw_text), llm_api_key, llm_provider)
+            _apply_extraction(results, extracted_data)
+        except Exception as e:
+            print(f"An error occurred during LLM analysis of {file_paths[i]}: {e}")
+
+    if not pending:
+        return all_results
+    system_instructions = []
+    prompts = []
+    for i in pending:
+        system_instruction, user_template = get_prompt_template(detect_doc_type(all_results[i]["raw_text"]))
+        system_instructions.append(system_instruction)
+        prompts.append(fill_prompt(user_template, all_results[i]["raw_text"]))
+
+    # 3. Send all prompts to the LLM in one batch
+    print(f"Sending {len(prompts)} documents to LLM ({llm_provider}) for analysis...")
+    try:
+        llm_outputs = get_llm_responses(prompts, llm_api_key, llm_provider,
+                                        system_instructions=system_instructions)
+    except Exception as e:
+        print(f"An error occurred during the document analysis pipeline: {e}")
+        return all_results
+    print("LLM analysis complete.")
+
+    # 4. Parse and transform each LLM output for display; a bad output only fails its own document
+    for i, llm_output_json_str in zip(pending, llm_outputs):
+        try:
+            _apply_extraction(all_results[i], parse_llm_json(llm_output_json_str))
+        except json.JSONDecodeError as e: # Also catches orjson.JSONDecodeError (a subclass)
+            print(f"Error: LLM did not return valid JSON for {file_paths[i]}: {e}")
+            print(f"LLM Raw Output:\n{llm_output_json_str}")
+        except Exception as e:
+            print(f"An error occurred during data transformation for {file_paths[i]}: {e}")
+    print("Data transformation complete.")
+
+    return all_results
+
+async def _analyze_chunk_async(text: str, doc_type: str, llm_api_key: str, llm_provider: str, partial: bool) -> dict:
+    """Sends one piece of document text to the LLM from a worker thread and parses the JSON response."""
+    system_instruction, user_template = get_prompt_template(doc_type, partial)
+    prompt = fill_prompt(user_template, text)
+    return await asyncio.to_thread(
+        get_llm_response, prompt, llm_api_key, llm_provider, system_instruction=system_instruction, parse=True
+    )
+
+async def analyze_streaming(
+    file_path: str,
+    llm_api_key: str,
+    llm_provider: str = "gemini"
+) -> dict:
+    """
+    Executes the full document analysis pipeline, reading the OCR'd text page by page.
+
+    Documents within the MAX_INPUT_TOKENS budget (nearly all uploads) are analyzed with
+    one full-prompt request once OCR is done, exactly like `_extract_data`, so OCR and
+    LLM analysis do not overlap. Only when the text collected so far exceeds that budget
+    is it split into 30k-character chunks, which are sent to the LLM while later pages
+    are still being OCR'd.
+
+    Args:
+        file_path (str): Path to the input document (PDF, JPG, PNG).
+        llm_api_key (str): API key for the LLM service.
+        llm_provider (str): The LLM provider to use ('openai' or 'gemini').
+
+    Returns:
+        dict: A dictionary with the same keys as `analyze_document_pipeline` returns.
+
+    Raises:
+        json.JSONDecodeError: If the LLM does not return valid JSON.
+        Exception: For OCR or LLM API errors, so callers can report them.
+    """
+    results = _empty_results()
+    llm_tasks = []
+
+    try:
+        # 1. OCR pages, starting LLM analysis of each chunk as soon as it is large enough
+        print(f"Starting streaming analysis for {file_path}...")
+        page_texts = []
+        chunk_pages = []
+        chunk_len = 0
+        total_len = 0
+        doc_type = None
+        async for page_text in iter_page_texts(file_path):
+            page_texts.append(page_text)
+            chunk_pages.append(page_text)
+            chunk_len += len(page_text) + 1
+            total_len += len(page_text) + 1
+            # Chunk only once the document is known to be too long for a single request,
+            # then keep sending chunks of the same size as analyze_text_in_chunks uses
+            if total_len // 4 > MAX_INPUT_TOKENS and chunk_len > _CHUNK_CHARS:
+                pending_text = "\n".join(chunk_pages)
+                if doc_type is None: # Classify from the first chunk so every chunk uses the same prompt
+                    doc_type = detect_doc_type(pending_text)
+                for chunk in _split_text(pending_text):
+                    llm_tasks.append(asyncio.create_task(
+                        _analyze_chunk_async(chunk, doc_type, llm_api_key, llm_provider, partial=True)
+                    ))
+                chunk_pages = []
+                chunk_len = 0
+
+        raw_text = "\n".join(page_texts)
+        results["raw_text"] = raw_text
+        print("OCR complete.")
+
+        if not raw_text.strip():
+            print("No text extracted by OCR. Skipping LLM analysis.")
+            return results
+
+        # 2. Analyze what is left: the whole document if it fit in one chunk, else the tail
+        remainder = "\n".join(chunk_pages)
+        if not llm_tasks:
+            doc_type = detect_doc_type(raw_text)
+            llm_tasks.append(asyncio.create_task(
+                _analyze_chunk_async(raw_text, doc_type, llm_api_key, llm_provider, partial=False)
+            ))
+        elif remainder.strip():
+            for chunk in _split_text(remainder):
+                llm_tasks.append(asyncio.create_task(
+                    _analyze_chunk_async(chunk, doc_type, llm_api_key, llm_provider, partial=True)
+                ))
+        print(f"Waiting for {len(llm_tasks)} LLM request(s) ({llm_provider}) with '{doc_type}' prompt...")
+
+        partials = await asyncio.gather(*llm_tasks)
+        extracted_data = partials[0] if len(partials) == 1 else _merge_extractions(partials)
+        print("LLM analysis complete.")
+
+        # 3. Transform LLM output for display
+        _apply_extraction(results, extracted_data)
+        print("Data transformation complete.")
+
+    except Exception as e:
+        print(f"An error occurred during the document analysis pipeline: {e}")
+        raise # Let the caller show the error instead of an empty result
+    finally:
+        for task in llm_tasks: # Don't leave requests running after a failure
+            task.cancel()
+
+    return results
+
+async def analyze_documents_async(
+    file_paths: list[str],
+    llm_api_key: str,
+    llm_provider: str = "gemini",
+    generate_pdf: bool = False,
+    llm_concurrency: int = 4
+) -> list[dict]:
+    """
+    Executes the analysis pipeline for several documents with the stages overlapping.
+
+    OCR, LLM analysis and PDF generation run as separate stages connected by bounded
+    queues, so while one document is with the LLM the next is already being OCR'd and
+    the previous one rendered. The blocking OCR and PDF calls run in worker threads.
+
+    Args:
+        file_paths (list[str]): Paths to the input documents (PDF, JPG, PNG).
+        llm_api_key (str): API key for the LLM service.
+        llm_provider (str): The LLM provider to use ('openai' or 'gemini').
+        generate_pdf (bool): Whether to also render a PDF summary of each analyzed document.
+        llm_concurrency (int): How many documents may be with the LLM at the same time.
+
+    Returns:
+        list[dict]: One results dictionary per document, in the same order as `file_paths`,
+                    with the same keys as `analyze_document_pipeline` returns, plus
+                    "pdf_bytes" when `generate_pdf` is True.
+    """
+    all_results = [_empty_results() for _ in file_paths]
+    # Bounded queues keep a fast stage from running far ahead of a slow one;
+    # None tells the next stage that no more documents are coming
+    ocr_to_llm = asyncio.Queue(maxsize=os.cpu_count() or 1)
+    llm_to_pdf = asyncio.Queue(maxsize=os.cpu_count() or 1)
+
+    async def ocr_stage():
+        for i, file_path in enumerate(file_paths):
+            print(f"Starting OCR for {file_path}...")
+            try:
+                all_results[i]["raw_text"] = await asyncio.to_thread(extract_text_from_document, file_path)
+            except Exception as e:
+                print(f"An error occurred during OCR of {file_path}: {e}")
+                continue
+            await ocr_to_llm.put(i)
+        for _ in range(llm_concurrency):
+            await ocr_to_llm.put(None)
+
+    async def llm_worker():
+        while (i := await ocr_to_llm.get()) is not None:
+            results = all_results[i]
+            raw_text = results["raw_text"]
+            if not raw_text.strip():
+                print(f"No text extracted by OCR from {file_paths[i]}. Skipping LLM analysis.")
+                continue
+            # A failure here only skips this document; letting it escape would end the worker
+            # and, through gather, the whole batch
+            try:
+                extracted_data = await asyncio.to_thread(
+                    _extract_data, raw_text, detect_doc_type(raw_text), llm_api_key, llm_provider
+                )
+                _apply_extraction(results, extracted_data)
+            except json.JSONDecodeError as e: # Also catches orjson.JSONDecodeError (a subclass)
+                print(f"Error: LLM did not return valid JSON for {file_paths[i]}: {e}")
+                continue
+            except Exception as e:
+                print(f"An error occurred during LLM analysis of {file_paths[i]}: {e}")
+                continue
+            if generate_pdf:
+                await llm_to_pdf.put(i)
+
+    async def llm_stage():
+        await asyncio.gather(*[llm_worker() for _ in range(llm_concurrency)])
+        await llm_to_pdf.put(None)
+
+    async def pdf_stage():
+        # Imported here so text-only callers don't need WeasyPrint's system libraries
+        from core.pdf_generator import create_pdf_summary_weasyprint
+        while (i := await llm_to_pdf.get()) is not None:
+            try:
+                all_results[i]["pdf_bytes"] = await asyncio.to_thread(
+                    create_pdf_summary_weasyprint, all_results[i]["extracted_data"],
+                    doc_type=detect_doc_type(all_results[i]["raw_text"])
+                )
+            except Exception as e:
+                print(f"An error occurred during PDF generation for {file_paths[i]}: {e}")
+
+    stages = [ocr_stage(), llm_stage()]
+    if generate_pdf:
+        stages.append(pdf_stage())
+    await asyncio.gather(*stages)
+    return all_results
+
 if __name__ == '__main__':
     # Example usage (for testing the full pipeline independently)
     from dotenv import load_dotenv
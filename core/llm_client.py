@@ -1,10 +1,140 @@
 import os
+import re
 import json
 import time
+import asyncio
+import functools
+import hashlib
+import struct
+import threading
+from collections import OrderedDict
+import orjson
 # from openai import OpenAI # Commented out as we are switching to Gemini
 import google.generativeai as genai # Uncommented for Google Gemini API
+from google.ai import generativelanguage as glm
 
-def get_llm_response(prompt: str, api_key: str, provider: str = "gemini", model: str = None) -> str:
+# Generation settings shared by every Gemini request
+_GEN_CFG = {
+    "response_mime_type": "application/json", # Request JSON output
+    "temperature": 0.0 # Keep temperature low for factual extraction
+}
+
+# sha256 of a request -> raw response text, least recently used first. Extraction runs at
+# temperature 0, so an identical request (e.g. a re-uploaded document) can reuse the earlier
+# response. Only responses holding a JSON object are kept, so a retry after a malformed
+# response asks the model again.
+_RESPONSE_CACHE_SIZE = 64 # Most responses kept, like the app's st.cache_data layers
+_RESPONSE_CACHE: OrderedDict[bytes, str] = OrderedDict()
+_RESPONSE_CACHE_LOCK = threading.Lock() # Batched and streaming requests run in worker threads
+
+def _cache_key(provider: str, model: str, system_instruction: str, prompt: str, api_key: str) -> bytes:
+    """
+    Returns the response cache key for a request.
+
+    The API key is part of the key, so a response fetched with one key is never served to
+    a caller using another (e.g. an invalid) key.
+
+    The fields are fed to sha256 one by one instead of serializing the request to JSON first,
+    so a long prompt is encoded once and never escaped or copied into a larger string.
+    """
+    h = hashlib.sha256()
+    h.update(provider.encode())
+    h.update(b"\x00")
+    h.update(model.encode())
+    h.update(struct.pack("<d", _GEN_CFG["temperature"]))
+    # A missing system instruction must not collide with an empty one
+    h.update(b"\x00" if system_instruction is None else b"\x01" + system_instruction.encode())
+    h.update(b"\x00")
+    h.update(prompt.encode())
+    h.update(b"\x00")
+    h.update(api_key.encode())
+    return h.digest()
+
+def _cache_get(key: bytes) -> str | None:
+    """Returns the cached response for `key`, or None, marking it as recently used."""
+    with _RESPONSE_CACHE_LOCK:
+        text = _RESPONSE_CACHE.get(key)
+        if text is not None:
+            _RESPONSE_CACHE.move_to_end(key)
+        return text
+
+def _cache_put(key: bytes, text: str) -> None:
+    """Caches a response, evicting the least recently used ones beyond _RESPONSE_CACHE_SIZE."""
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE[key] = text
+        _RESPONSE_CACHE.move_to_end(key)
+        while len(_RESPONSE_CACHE) > _RESPONSE_CACHE_SIZE:
+            _RESPONSE_CACHE.popitem(last=False)
+
+def clear_cache() -> None:
+    """Empties the in-process LLM response cache."""
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE.clear()
+
+# Outermost {...} span, used to recover JSON wrapped in ```json fences or commentary
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+def parse_llm_json(text: str) -> dict:
+    """
+    Parses the LLM's JSON output, tolerating Markdown fences or commentary around the object.
+
+    Recovering the object locally avoids another LLM round-trip when the model wraps
+    otherwise valid JSON despite being asked for JSON only.
+
+    Args:
+        text (str): The raw response text from the LLM.
+
+    Returns:
+        dict: The parsed JSON object.
+
+    Raises:
+        json.JSONDecodeError: If no JSON object can be recovered from `text`, including when
+                              the response is valid JSON of another type (e.g. a list or null).
+    """
+    try:
+        data = orjson.loads(text)
+    except orjson.JSONDecodeError:
+        match = _JSON_OBJECT_RE.search(text or "")
+        if match:
+            try:
+                data = orjson.loads(match.group(0))
+            except orjson.JSONDecodeError:
+                pass
+            else:
+                if isinstance(data, dict):
+                    return data
+        raise # Report the error against the full response
+    if not isinstance(data, dict):
+        raise json.JSONDecodeError(f"Expected a JSON object, got {type(data).__name__}", text, 0)
+    return data
+
+def _cache_if_valid(key: bytes, text: str) -> dict | None:
+    """Caches a fresh response only if it holds a JSON object; returns the parsed object, or None."""
+    try:
+        data = parse_llm_json(text)
+    except json.JSONDecodeError: # Also catches orjson.JSONDecodeError (a subclass)
+        return None
+    _cache_put(key, text)
+    return data
+
+@functools.lru_cache(maxsize=8)
+def _get_gemini_client(api_key: str, model: str, system_instruction: str = None) -> genai.GenerativeModel:
+    """
+    Builds a Gemini model client once per (api_key, model, system_instruction).
+
+    Each model gets its own service client authenticated with `api_key`. The SDK would
+    otherwise bind the client set up by the process-global `genai.configure` on first use,
+    so a model cached for one key could end up sending requests with another.
+
+    Keeping the system instruction on the model, separate from the per-document content,
+    gives every request for the same document type an identical prefix that Gemini can cache.
+    """
+    client = genai.GenerativeModel(model_name=model, system_instruction=system_instruction)
+    client._client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+    return client
+
+def get_llm_response(prompt: str, api_key: str, provider: str = "gemini", model: str = None,
+                     system_instruction: str = None, parse: bool = False) -> str | dict:
     """
     Sends a prompt to the specified LLM provider (OpenAI or Gemini) and returns the response.
 
@@ -13,12 +143,17 @@ def get_llm_response(prompt: str, api_key: str, provider: str = "gemini", model:
         api_key (str): The API key for the chosen LLM provider.
         provider (str): The LLM provider to use ('openai' or 'gemini'). Defaults to 'gemini'.
         model (str, optional): The specific model name to use. If None, uses default for provider.
+        system_instruction (str, optional): Static instructions sent separately from `prompt`.
+        parse (bool): If True, parse the response as JSON and return the resulting dict.
 
     Returns:
-        str: The LLM's response, expected to be a JSON string.
+        str | dict: The LLM's response, expected to be a JSON string, or the parsed
+                    JSON when `parse` is True.
 
     Raises:
-        ValueError: If an unsupported provider is specified or API key is missing.
+        ValueError: If an unsupported or disabled provider (currently 'openai') is specified
+                    or API key is missing.
+        json.JSONDecodeError: If `parse` is True and the response is not a JSON object.
         Exception: For API call errors.
     """
     if not api_key:
@@ -34,44 +169,128 @@ def get_llm_response(prompt: str, api_key: str, provider: str = "gemini", model:
         #     response = client.chat.completions.create(
         #         model=model,
         #         messages=[
-        #             {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
+        #             # The extraction schema and "JSON only" rules live in the system instruction
+        #             {"role": "system", "content": system_instruction or "You are a helpful assistant designed to output JSON."},
         #             {"role": "user", "content": prompt}
         #         ],
         #         response_format={"type": "json_object"},
         #         temperature=0.0
         #     )
-        #     return response.choices[0].message.content
+        #     text = response.choices[0].message.content
         # except Exception as e:
         #     print(f"An error occurred with OpenAI API: {e}")
         #     raise
-        pass # Placeholder if OpenAI block is commented out
+        # return parse_llm_json(text) if parse else text
+        # Fail loudly while the block above is commented out, rather than returning None
+        raise ValueError("The OpenAI provider is currently disabled. Use 'gemini' instead.")
 
     elif provider == "gemini":
-        genai.configure(api_key=api_key)
         if model is None:
             model = "gemini-1.5-flash" # Recommended latest Gemini Flash model
 
-        try:
-            client = genai.GenerativeModel(model_name=model)
-            
-            # For structured output, we instruct the model in the prompt
-            # and set response_mime_type in generation_config.
-            response = client.generate_content(
-                prompt,
-                generation_config={
-                    "response_mime_type": "application/json", # Request JSON output
-                    "temperature": 0.0 # Keep temperature low for factual extraction
-                }
-            )
+        cache_key = _cache_key(provider, model, system_instruction, prompt, api_key)
+        text = _cache_get(cache_key)
+        data = None
+        if text is None:
+            try:
+                client = _get_gemini_client(api_key, model, system_instruction)
+
+                # For structured output, we instruct the model in the prompt
+                # and set response_mime_type in generation_config.
+                response = client.generate_content(prompt, generation_config=_GEN_CFG)
+            except Exception as e:
+                print(f"An unexpected error occurred with Gemini API: {e}")
+                raise
             # Gemini's response for JSON output is typically in response.text
-            return response.text
-        except Exception as e:
-            print(f"An unexpected error occurred with Gemini API: {e}")
-            raise
+            text = response.text
+            data = _cache_if_valid(cache_key, text)
+
+        if not parse:
+            return text
+        return data if data is not None else parse_llm_json(text)
 
     else:
         raise ValueError(f"Unsupported LLM provider: {provider}. Choose 'openai' or 'gemini'.")
 
+async def _gemini_generate_all(clients: list[genai.GenerativeModel], prompts: list[str],
+                               max_concurrency: int = 8) -> list[str]:
+    """
+    Sends several prompts to Gemini concurrently, with at most `max_concurrency` requests in flight.
+
+    Returns:
+        list[str]: The response text for each prompt, in the same order as `prompts`.
+    """
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def _one(client: genai.GenerativeModel, prompt: str) -> str:
+        async with sem:
+            # The blocking SDK call runs in a worker thread; unlike generate_content_async,
+            # this does not tie the cached client to one asyncio.run() event loop.
+            response = await asyncio.to_thread(client.generate_content, prompt, generation_config=_GEN_CFG)
+            return response.text
+
+    return await asyncio.gather(*[_one(c, p) for c, p in zip(clients, prompts)])
+
+def get_llm_responses(prompts: list[str], api_key: str, provider: str = "gemini", model: str = None,
+                      system_instructions: list[str] = None, parse: bool = False) -> list[str] | list[dict]:
+    """
+    Sends a batch of independent prompts to the LLM provider and returns all responses.
+
+    For Gemini the requests are issued concurrently, so the batch takes roughly as long
+    as its slowest prompt rather than the sum of all of them. Prompts already in the
+    response cache are not sent again.
+
+    Args:
+        prompts (list[str]): The prompt texts to send to the LLM.
+        api_key (str): The API key for the chosen LLM provider.
+        provider (str): The LLM provider to use ('openai' or 'gemini'). Defaults to 'gemini'.
+        model (str, optional): The specific model name to use. If None, uses default for provider.
+        system_instructions (list[str], optional): The system instruction for each prompt.
+        parse (bool): If True, parse each response as JSON and return the resulting dicts.
+
+    Returns:
+        list[str] | list[dict]: The LLM's responses (expected to be JSON strings, or parsed
+                                when `parse` is True), in the same order as `prompts`.
+
+    Raises:
+        ValueError: If an unsupported or disabled provider (currently 'openai') is specified
+                    or API key is missing.
+        json.JSONDecodeError: If `parse` is True and a response is not a JSON object.
+        Exception: For API call errors.
+    """
+    if not api_key:
+        raise ValueError(f"API key is missing for LLM provider: {provider}")
+    if system_instructions is None:
+        system_instructions = [None] * len(prompts)
+
+    if provider == "gemini":
+        if model is None:
+            model = "gemini-1.5-flash" # Recommended latest Gemini Flash model
+
+        cache_keys = [_cache_key(provider, model, si, p, api_key) for si, p in zip(system_instructions, prompts)]
+        responses = [_cache_get(k) for k in cache_keys]
+        parsed = [None] * len(prompts) # Fresh responses already parsed while caching them
+        misses = [i for i, r in enumerate(responses) if r is None]
+        if misses:
+            try:
+                clients = [_get_gemini_client(api_key, model, system_instructions[i]) for i in misses]
+                fresh = asyncio.run(_gemini_generate_all(clients, [prompts[i] for i in misses]))
+            except Exception as e:
+                print(f"An unexpected error occurred with Gemini API: {e}")
+                raise
+            for i, text in zip(misses, fresh):
+                responses[i] = text
+                parsed[i] = _cache_if_valid(cache_keys[i], text)
+        if not parse:
+            return responses
+        return [d if d is not None else parse_llm_json(r) for d, r in zip(parsed, responses)]
+
+    # Other providers have no concurrent path; send the prompts one by one
+    return [
+        get_llm_response(prompt, api_key, provider, model, system_instruction=si, parse=parse)
+        for prompt, si in zip(prompts, system_instructions)
+    ]
+
 if __name__ == '__main__':
     # Example usage (for testing this module independently)
     from dotenv import load_dotenv
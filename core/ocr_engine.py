@@ -1,12 +1,258 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Iterator
+
 import pytesseract
 from PIL import Image
 import fitz # PyMuPDF for PDF handling
-import os
+
+try:
+    # Optional: binarize and deskew scanned pages before OCR
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
+
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg']
+RENDER_DPI = 300 # Resolution PDF pages are rendered at for OCR
+MAX_RENDER_EDGE = 3508 # Cap on the long edge of a rendered page, in pixels (A4 at 300 DPI)
+OCR_BATCH_PAGES = 8 # Most pages handed to one Tesseract run
+
+_OCR_POOL = None # Process-wide OCR worker pool, created on first use
+_OCR_POOL_LOCK = threading.Lock()
+
+# sha256 of an image file's bytes -> its OCR text, least recently used first, so the same
+# image (e.g. a re-upload under another name) is not run through Tesseract twice in one process
+_OCR_CACHE_SIZE = 64 # Most results kept, like the app's cached_ocr
+_OCR_CACHE: OrderedDict[bytes, str] = OrderedDict()
+_OCR_CACHE_LOCK = threading.Lock() # Images may be OCR'd from several threads at once
+
+def clear_ocr_cache() -> None:
+    """Empties the in-process OCR result cache."""
+    with _OCR_CACHE_LOCK:
+        _OCR_CACHE.clear()
+
+def _ocr_concurrency() -> int:
+    """Returns how many Tesseract processes may run at once (OCR_CONCURRENCY, default: CPU count)."""
+    return int(os.getenv("OCR_CONCURRENCY", os.cpu_count() or 1))
+
+def _ocr_image_file(file_path: str) -> str:
+    """OCRs a single image file; results are cached by content."""
+    with open(file_path, "rb") as f:
+        data = f.read()
+    key = hashlib.sha256(data).digest()
+    with _OCR_CACHE_LOCK:
+        text = _OCR_CACHE.get(key)
+        if text is not None:
+            _OCR_CACHE.move_to_end(key)
+            return text
+
+    image = Image.open(io.BytesIO(data)) # Decode the bytes already read for the hash
+    text = pytesseract.image_to_string(image)
+    with _OCR_CACHE_LOCK:
+        _OCR_CACHE[key] = text
+        _OCR_CACHE.move_to_end(key)
+        while len(_OCR_CACHE) > _OCR_CACHE_SIZE:
+            _OCR_CACHE.popitem(last=False)
+    return text
+
+def _init_ocr_worker() -> None:
+    """
+    Process-pool initializer: keeps each worker's Tesseract single-threaded so workers
+    don't fight over cores.
+    """
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+def _preprocess_for_ocr(image: Image.Image) -> Image.Image:
+    """
+    Binarizes a scanned page with Otsu's threshold and rotates it so its text lines are
+    horizontal, which makes Tesseract both faster and more accurate on skewed scans.
+    """
+    gray = np.asarray(image.convert("L"))
+    _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    coords = np.column_stack(np.where(bw == 0)[::-1]).astype(np.float32) # (x, y) of dark pixels
+    if len(coords) < 2: # Blank page, nothing to deskew
+        return Image.fromarray(bw)
+    angle = cv2.minAreaRect(coords)[-1]
+    # Map the rectangle angle to the smallest rotation (OpenCV versions differ in range)
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    h, w = bw.shape
+    rotation = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    # Nearest-neighbour keeps the rotated page strictly black and white
+    rotated = cv2.warpAffine(bw, rotation, (w, h), flags=cv2.INTER_NEAREST, borderMode=cv2.BORDER_REPLICATE)
+    return Image.fromarray(rotated)
+
+def _preprocess_png(png_bytes: bytes) -> bytes:
+    """Applies `_preprocess_for_ocr` to a PNG-encoded page, keeping its recorded DPI."""
+    image = Image.open(io.BytesIO(png_bytes))
+    dpi = image.info.get("dpi", (RENDER_DPI, RENDER_DPI))
+    buffer = io.BytesIO()
+    _preprocess_for_ocr(image).save(buffer, format="PNG", dpi=dpi)
+    return buffer.getvalue()
+
+def _ocr_batch(pages: list[bytes]) -> list[str]:
+    """
+    Process-pool entry point for `_ocr_pages`; must stay a picklable module-level function.
+
+    pytesseract's exceptions can't be unpickled, which would break the whole pool and hide
+    the cause, so failures are re-raised as a plain RuntimeError carrying the message.
+    """
+    try:
+        return _ocr_pages(pages)
+    except Exception as e:
+        raise RuntimeError(f"Tesseract OCR failed: {e}") from None
+
+def _ocr_pages(pages: list[bytes]) -> list[str]:
+    """
+    OCRs several rendered pages with a single Tesseract run, fed through a list file of image paths.
+
+    One run per batch avoids paying Tesseract's process start-up and language model load
+    for every page.
+
+    With OpenCV installed the pages are binarized and deskewed first.
+
+    Args:
+        pages (list[bytes]): PNG-encoded page images.
+
+    Returns:
+        list[str]: The OCR text of each page, in the same order as `pages`.
+    """
+    if cv2 is not None:
+        pages = [_preprocess_png(png_bytes) for png_bytes in pages]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_paths = []
+        for i, png_bytes in enumerate(pages):
+            image_path = os.path.join(tmp_dir, f"page{i:03d}.png")
+            with open(image_path, "wb") as f:
+                f.write(png_bytes)
+            image_paths.append(image_path)
+        list_path = os.path.join(tmp_dir, "pages.txt")
+        with open(list_path, "w") as f:
+            f.write("\n".join(image_paths) + "\n")
+        output = pytesseract.image_to_string(list_path)
+    # Tesseract ends the text of every page with a form feed
+    page_texts = output.split("\f")[:len(pages)]
+    return page_texts + [""] * (len(pages) - len(page_texts))
+
+def _ocr_mp_context() -> multiprocessing.context.BaseContext:
+    """
+    Returns the multiprocessing context OCR workers are started with.
+
+    Workers come from a fork server rather than being forked from this process, which may
+    be running other threads (Streamlit, gRPC) that don't survive a fork. Platforms without
+    a fork server (Windows) use spawn, which is equally safe.
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+def _ocr_executor() -> ProcessPoolExecutor:
+    """
+    Returns the process-wide OCR pool (one Tesseract per worker, OCR_CONCURRENCY workers),
+    creating it on first use.
+
+    The pool is shared by every document, so concurrent extractions queue for the same
+    workers instead of each starting a pool of their own, and worker start-up is paid
+    once per process rather than once per document.
+    Workers are started on demand, so small documents don't start the full pool.
+    """
+    global _OCR_POOL
+    with _OCR_POOL_LOCK:
+        if _OCR_POOL is None:
+            _OCR_POOL = ProcessPoolExecutor(
+                max_workers=_ocr_concurrency(),
+                mp_context=_ocr_mp_context(),
+                initializer=_init_ocr_worker
+            )
+        return _OCR_POOL
+
+def _discard_ocr_executor(executor: ProcessPoolExecutor) -> None:
+    """Drops a broken pool (a worker died) so the next document starts a fresh one."""
+    global _OCR_POOL
+    with _OCR_POOL_LOCK:
+        if _OCR_POOL is executor:
+            _OCR_POOL = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def _render_page(page: fitz.Page) -> bytes:
+    """
+    Renders a PDF page for OCR as a grayscale PNG at RENDER_DPI, scaled down if needed
+    so its long edge stays within MAX_RENDER_EDGE pixels.
+
+    Grayscale at ~300 DPI is what Tesseract works best with; colour channels and larger
+    rasters only add pixels for it to process.
+    """
+    zoom = min(RENDER_DPI / 72, MAX_RENDER_EDGE / max(page.rect.width, page.rect.height))
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY)
+    pix.set_dpi(round(72 * zoom), round(72 * zoom)) # Recorded in the PNG so Tesseract knows the scale
+    return pix.tobytes("png")
+
+def _read_pdf_pages(file_path: str) -> tuple[list[str], list[int]]:
+    """
+    Reads the selectable text of every PDF page and finds the pages that have none.
+
+    Returns:
+        tuple[list[str], list[int]]: The text of each page ('' for pages that need OCR),
+                                     and the indices of the pages that need OCR.
+    """
+    with fitz.open(file_path) as doc:
+        page_texts = [page.get_text() for page in doc]
+    ocr_indices = [i for i, page_text in enumerate(page_texts) if not page_text.strip()]
+    for i in ocr_indices:
+        page_texts[i] = ""
+    return page_texts, ocr_indices
+
+def _ocr_pdf_pages(file_path: str, ocr_indices: list[int]) -> Iterator[tuple[int, str]]:
+    """
+    OCRs the given PDF pages in a process pool, yielding (page index, text) in page order.
+
+    Pages are rendered lazily, one batch at a time, and at most two batches per worker are
+    in flight, so memory stays bounded however many pages the document has.
+    """
+    if not ocr_indices:
+        return
+    n_workers = max(1, min(_ocr_concurrency(), len(ocr_indices)))
+    batch_size = max(1, min(OCR_BATCH_PAGES, -(-len(ocr_indices) // n_workers))) # Ceiling division
+    executor = _ocr_executor()
+    pending = deque() # (page indices, future) per submitted batch, oldest first
+    try:
+        with fitz.open(file_path) as doc:
+            for start in range(0, len(ocr_indices), batch_size):
+                batch = ocr_indices[start:start + batch_size]
+                pending.append((batch, executor.submit(_ocr_batch, [_render_page(doc[i]) for i in batch])))
+                if len(pending) >= 2 * n_workers:
+                    batch, future = pending.popleft()
+                    yield from zip(batch, future.result())
+        while pending:
+            batch, future = pending.popleft()
+            yield from zip(batch, future.result())
+    except BrokenProcessPool:
+        _discard_ocr_executor(executor)
+        raise
+    finally:
+        # Drop this document's pending OCR if the consumer bails out early; the pool stays up
+        for _, future in pending:
+            future.cancel()
 
 def extract_text_from_document(file_path: str) -> str:
     """
     Extracts text from an image or PDF document using Tesseract OCR and PyMuPDF.
 
+    Scanned PDF pages are rendered lazily in batches that are OCR'd in parallel in a process
+    pool, one Tesseract run per batch; the number of worker processes defaults to the CPU
+    count and can be set with OCR_CONCURRENCY.
+
     Args:
         file_path (str): The path to the document file (JPG, PNG, PDF).
 
@@ -16,28 +262,19 @@ def extract_text_from_document(file_path: str) -> str:
     text = ""
     file_extension = os.path.splitext(file_path)[1].lower()
 
-    if file_extension in ['.png', '.jpg', '.jpeg']:
+    if file_extension in IMAGE_EXTENSIONS:
         try:
-            # Use Pillow to open the image and pytesseract to extract text
-            text = pytesseract.image_to_string(Image.open(file_path))
+            # Use Pillow to open the image and Tesseract to extract text
+            text = _ocr_image_file(file_path)
         except Exception as e:
             print(f"Error extracting text from image {file_path}: {e}")
             raise
     elif file_extension == '.pdf':
         try:
-            doc = fitz.open(file_path)
-            for page_num in range(doc.page_count):
-                page = doc[page_num]
-                # Attempt direct text extraction first (for selectable PDFs)
-                page_text = page.get_text()
-                if page_text.strip(): # If direct text extraction yields content
-                    text += page_text
-                else:
-                    # Fallback to OCR for scanned PDFs (render page to image)
-                    pix = page.get_pixmap()
-                    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                    text += pytesseract.image_to_string(img)
-            doc.close()
+            page_texts, ocr_indices = _read_pdf_pages(file_path)
+            for page_num, page_text in _ocr_pdf_pages(file_path, ocr_indices):
+                page_texts[page_num] = page_text
+            text = "\n".join(page_texts)
         except Exception as e:
             print(f"Error extracting text from PDF {file_path}: {e}")
             raise
@@ -46,6 +283,54 @@ def extract_text_from_document(file_path: str) -> str:
 
     return text
 
+async def iter_page_texts(file_path: str) -> AsyncIterator[str]:
+    """
+    Asynchronously yields the text of each page of a document, in page order.
+
+    Scanned pages are OCR'd in a background process pool; each page is yielded as
+    soon as it and every page before it are done, so callers can start working on the
+    beginning of a document while the rest is still being OCR'd.
+
+    Args:
+        file_path (str): The path to the document file (JPG, PNG, PDF).
+
+    Yields:
+        str: The text of the next page (an image counts as a single page).
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+
+    if file_extension in IMAGE_EXTENSIONS:
+        yield await asyncio.to_thread(_ocr_image_file, file_path)
+    elif file_extension == '.pdf':
+        page_texts, ocr_indices = await asyncio.to_thread(_read_pdf_pages, file_path)
+        ocr_results = _ocr_pdf_pages(file_path, ocr_indices)
+        ocr_set = set(ocr_indices)
+        try:
+            for page_num, page_text in enumerate(page_texts):
+                if page_num in ocr_set:
+                    # Waiting on OCR blocks, so step the generator in a worker thread
+                    _, page_text = await asyncio.to_thread(next, ocr_results)
+                yield page_text
+        finally:
+            ocr_results.close()
+    else:
+        raise ValueError(f"Unsupported file type: {file_extension}. Only .png, .jpg, .jpeg, .pdf are supported.")
+
+def warm_up_ocr() -> None:
+    """
+    Runs Tesseract once on a tiny blank image so its language data is loaded (and in the
+    OS page cache) before the first real document, instead of on a user's first request.
+    """
+    blank = Image.new("L", (10, 10), 255)
+    try:
+        pytesseract.image_to_string(blank)
+    except Exception as e:
+        print(f"Tesseract warm-up failed: {e}")
+
+# Opt-in so tests and CI don't pay for (or need) a Tesseract run at import
+if os.getenv("OCR_WARMUP") == "1":
+    warm_up_ocr()
+
 if __name__ == '__main__':
     # Example usage (for testing this module independently)
     # Make sure you have a sample.png or sample.pdf in your data/raw folder
@@ -1,23 +1,152 @@
 from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
 from datetime import datetime
 import os
 import json
-import pandas as pd
+import html
+import base64
+import mimetypes
+import functools
 
-def create_pdf_summary_weasyprint(extracted_data: dict, doc_type: str = "Document", logo_path: str = None) -> bytes:
+# Shared across renders so WeasyPrint loads and registers the report fonts only once
+_FONT_CONFIG = FontConfiguration()
+
+_STYLES = """
+/* Fonts come from the local system instead of a Google Fonts download on every render */
+@font-face {
+    font-family: 'Roboto';
+    src: local('Roboto'), local('Roboto Regular');
+}
+@font-face {
+    font-family: 'Lato';
+    src: local('Lato'), local('Lato Regular');
+}
+body {
+    font-family: 'Roboto', sans-serif;
+    margin: 40px;
+    color: #333;
+    line-height: 1.6;
+}
+.header {
+    text-align: center;
+    margin-bottom: 30px;
+    padding-bottom: 10px;
+    border-bottom: 2px solid #eee;
+}
+.header img {
+    max-width: 150px;
+    height: auto;
+    margin-bottom: 10px;
+    border-radius: 8px; /* Rounded corners for logo */
+}
+.header h1 {
+    color: #2c3e50;
+    font-family: 'Lato', sans-serif;
+    font-size: 28px;
+    margin: 0;
+}
+h2 {
+    color: #34495e;
+    font-family: 'Lato', sans-serif;
+    font-size: 22px;
+    border-bottom: 1px solid #ddd;
+    padding-bottom: 5px;
+    margin-top: 30px;
+    margin-bottom: 15px;
+}
+table {
+    width: 100%;
+    border-collapse: collapse;
+    margin-bottom: 20px;
+    border-radius: 8px; /* Rounded corners for table */
+    overflow: hidden; /* Ensures corners apply */
+}
+th, td {
+    border: 1px solid #ddd;
+    padding: 10px;
+    text-align: left;
+}
+th {
+    background-color: #f2f2f2;
+    color: #555;
+    font-weight: bold;
+}
+tr:nth-child(even) {
+    background-color: #f9f9f9;
+}
+.summary-section p {
+    background-color: #f9f9f9;
+    border-left: 5px solid #3498db; /* Accent color border */
+    padding: 15px;
+    margin-bottom: 20px;
+    border-radius: 8px; /* Rounded corners for summary box */
+}
+.footer {
+    text-align: center;
+    margin-top: 50px;
+    padding-top: 10px;
+    border-top: 1px solid #eee;
+    font-size: 12px;
+    color: #777;
+}
+"""
+# Parsed once at import and passed to every render instead of an inline <style> block
+_STYLESHEET = CSS(string=_STYLES, font_config=_FONT_CONFIG)
+
+_LOGO_CACHE: dict[str, tuple[float, str]] = {} # logo path -> (mtime, data URI)
+
+def _get_logo_data_uri(logo_path: str) -> str:
     """
-    Generates a styled PDF summary from extracted document data using WeasyPrint.
+    Returns the logo as a base64 data URI, so WeasyPrint doesn't fetch the file on every render.
 
-    Args:
-        extracted_data (dict): A dictionary containing the extracted information from the LLM.
-                               Expected to have keys like 'invoice_number', 'summary', 'items', etc.
-        doc_type (str): The type of document (e.g., 'Invoice', 'Contract', 'Document'). Used for title.
-        logo_path (str): Path to a company logo image. If provided, it will be included.
+    The encoded logo is cached per path and re-read only when the file's mtime changes.
+    """
+    mtime = os.path.getmtime(logo_path)
+    cached = _LOGO_CACHE.get(logo_path)
+    if cached is None or cached[0] != mtime:
+        mime_type = mimetypes.guess_type(logo_path)[0] or "image/png"
+        with open(logo_path, "rb") as f:
+            encoded = base64.b64encode(f.read()).decode("ascii")
+        cached = _LOGO_CACHE[logo_path] = (mtime, f"data:{mime_type};base64,{encoded}")
+    return cached[1]
 
-    Returns:
-        bytes: The PDF content as bytes.
+def _fmt(value) -> str:
+    """Formats an extracted field value for display: lists are comma-joined, missing values shown as N/A."""
+    if value is None:
+        return "N/A"
+    if isinstance(value, list):
+        return ", ".join(map(str, value))
+    return str(value)
+
+def _item_table_html(items: list) -> str:
     """
-    
+    Renders invoice/form line items as an HTML table, one column per key seen in the items.
+
+    Cell values are HTML-escaped since they come straight from the document text.
+    """
+    records = [item if isinstance(item, dict) else {"value": item} for item in items]
+    columns = list(dict.fromkeys(key for record in records for key in record))
+    header = "".join(f"<th>{html.escape(column.replace('_', ' ').title())}</th>" for column in columns)
+    rows = []
+    for record in records:
+        cells = "".join(
+            f"<td>{html.escape(_fmt(record.get(column)))}</td>"
+            for column in columns
+        )
+        rows.append(f"<tr>{cells}</tr>")
+    return f'<table class="item-table"><thead><tr>{header}</tr></thead><tbody>{"".join(rows)}</tbody></table>'
+
+@functools.lru_cache(maxsize=128)
+def _render_body(doc_type: str, data_json: str, logo_uri: str | None) -> str:
+    """
+    Builds the report HTML up to (not including) the footer.
+
+    The data arrives serialized so the call can be cached: re-rendering the same extraction
+    (e.g. downloading a report twice) reuses the HTML. The footer carries the generation
+    timestamp, so it is left out of the cached part.
+    """
+    extracted_data = json.loads(data_json)
+
     # Prepare data for display in PDF
     main_fields = {}
     item_data_html = ""
@@ -26,9 +155,7 @@ def create_pdf_summary_weasyprint(extracted_data: dict, doc_type: str = "Documen
     for key, value in extracted_data.items():
         if key == 'items' and isinstance(value, list):
             if value: # Only process if items list is not empty
-                item_df = pd.DataFrame(value)
-                # Convert DataFrame to HTML table
-                item_data_html = item_df.to_html(index=False, classes="item-table")
+                item_data_html = _item_table_html(value)
         elif key in ['summary', 'key_clauses_summary', 'overall_summary']:
             if key == 'overall_summary' and value:
                 summary_content = value
@@ -39,133 +166,74 @@ def create_pdf_summary_weasyprint(extracted_data: dict, doc_type: str = "Documen
         else:
             main_fields[key] = value
 
-    # Generate HTML content for the PDF
-    html_content = f"""
+    # Generate HTML content for the PDF as a list of parts, joined once at the end
+    title = html.escape(doc_type.capitalize())
+    parts = [f"""
     <!DOCTYPE html>
     <html>
     <head>
-        <title>{doc_type.capitalize()} Analysis Summary</title>
-        <link href="https://fonts.googleapis.com/css2?family=Roboto:wght@400;700&family=Lato:wght@400;700&display=swap" rel="stylesheet">
-        <style>
-            @import url('https://fonts.googleapis.com/css2?family=Roboto:wght@400;700&family=Lato:wght@400;700&display=swap');
-            body {{
-                font-family: 'Roboto', sans-serif;
-                margin: 40px;
-                color: #333;
-                line-height: 1.6;
-            }}
-            .header {{
-                text-align: center;
-                margin-bottom: 30px;
-                padding-bottom: 10px;
-                border-bottom: 2px solid #eee;
-            }}
-            .header img {{
-                max-width: 150px;
-                height: auto;
-                margin-bottom: 10px;
-                border-radius: 8px; /* Rounded corners for logo */
-            }}
-            .header h1 {{
-                color: #2c3e50;
-                font-family: 'Lato', sans-serif;
-                font-size: 28px;
-                margin: 0;
-            }}
-            h2 {{
-                color: #34495e;
-                font-family: 'Lato', sans-serif;
-                font-size: 22px;
-                border-bottom: 1px solid #ddd;
-                padding-bottom: 5px;
-                margin-top: 30px;
-                margin-bottom: 15px;
-            }}
-            table {{
-                width: 100%;
-                border-collapse: collapse;
-                margin-bottom: 20px;
-                border-radius: 8px; /* Rounded corners for table */
-                overflow: hidden; /* Ensures corners apply */
-            }}
-            th, td {{
-                border: 1px solid #ddd;
-                padding: 10px;
-                text-align: left;
-            }}
-            th {{
-                background-color: #f2f2f2;
-                color: #555;
-                font-weight: bold;
-            }}
-            tr:nth-child(even) {{
-                background-color: #f9f9f9;
-            }}
-            .summary-section p {{
-                background-color: #f9f9f9;
-                border-left: 5px solid #3498db; /* Accent color border */
-                padding: 15px;
-                margin-bottom: 20px;
-                border-radius: 8px; /* Rounded corners for summary box */
-            }}
-            .footer {{
-                text-align: center;
-                margin-top: 50px;
-                padding-top: 10px;
-                border-top: 1px solid #eee;
-                font-size: 12px;
-                color: #777;
-            }}
-        </style>
+        <title>{title} Analysis Summary</title>
     </head>
     <body>
-    """
+    """]
     
     # Header with optional logo
-    if logo_path and os.path.exists(logo_path):
-        html_content += f"""
+    if logo_uri:
+        parts.append(f"""
         <div class="header">
-            <img src="file:///{os.path.abspath(logo_path)}" alt="Company Logo">
-            <h1>{doc_type.capitalize()} Analysis Report</h1>
+            <img src="{logo_uri}" alt="Company Logo">
+            <h1>{title} Analysis Report</h1>
         </div>
-        """
+        """)
     else:
-        html_content += f"""
+        parts.append(f"""
         <div class="header">
-            <h1>{doc_type.capitalize()} Analysis Report</h1>
+            <h1>{title} Analysis Report</h1>
         </div>
-        """
+        """)
 
     # Extracted Key Data Table
     if main_fields:
-        html_content += "<h2>Extracted Key Data</h2>"
-        html_content += "<table>"
-        for key, value in main_fields.items():
-            # Format key for display
-            display_key = key.replace('_', ' ').title()
-            if isinstance(value, list):
-                display_value = ", ".join(map(str, value))
-            elif value is None:
-                display_value = "N/A"
-            else:
-                display_value = str(value)
-            html_content += f"<tr><th>{display_key}</th><td>{display_value}</td></tr>"
-        html_content += "</table>"
+        rows = "".join(
+            f"<tr><th>{html.escape(key.replace('_', ' ').title())}</th><td>{html.escape(_fmt(value))}</td></tr>"
+            for key, value in main_fields.items()
+        )
+        parts.append(f"<h2>Extracted Key Data</h2><table>{rows}</table>")
 
     # Handle line items for invoices/forms
     if item_data_html:
-        html_content += "<h2>Line Items / Details</h2>"
-        html_content += item_data_html
+        parts.append("<h2>Line Items / Details</h2>")
+        parts.append(item_data_html)
 
     # Summary Paragraph
     if summary_content:
-        html_content += "<div class='summary-section'>"
-        html_content += f"<h2>Summary</h2><p>{summary_content}</p>"
-        html_content += "</div>"
+        parts.append(f"<div class='summary-section'><h2>Summary</h2><p>{html.escape(str(summary_content))}</p></div>")
+
+    return "".join(parts)
+
+def create_pdf_summary_weasyprint(extracted_data: dict, doc_type: str = "Document", logo_path: str = None,
+                                  target=None) -> bytes | None:
+    """
+    Generates a styled PDF summary from extracted document data using WeasyPrint.
+
+    Args:
+        extracted_data (dict): A dictionary containing the extracted information from the LLM.
+                               Expected to have keys like 'invoice_number', 'summary', 'items', etc.
+        doc_type (str): The type of document (e.g., 'Invoice', 'Contract', 'Document'). Used for title.
+        logo_path (str): Path to a company logo image. If provided, it will be included.
+        target (str | file-like, optional): A path or writable binary file to write the PDF to
+                                            directly, without building it as bytes first.
+
+    Returns:
+        bytes | None: The PDF content as bytes, or None if it was written to `target`.
+    """
+    # Key order is kept (not sorted) since it decides the order of the rows in the report
+    data_json = json.dumps(dict(extracted_data), default=str)
+    logo_uri = _get_logo_data_uri(logo_path) if logo_path and os.path.exists(logo_path) else None
 
     # Timestamp & footer
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    html_content += f"""
+    html_content = _render_body(doc_type, data_json, logo_uri) + f"""
         <div class="footer">
             Generated on: {timestamp}<br>
             Document Analysis Using LLMs - &copy; 2025
@@ -176,9 +244,10 @@ def create_pdf_summary_weasyprint(extracted_data: dict, doc_type: str = "Documen
 
     # Generate PDF
     try:
-        # WeasyPrint can directly take HTML string and generate PDF bytes
-        pdf_file_bytes = HTML(string=html_content).write_pdf()
-        return pdf_file_bytes
+        # WeasyPrint can directly take HTML string and generate PDF bytes, or write to `target`
+        return HTML(string=html_content).write_pdf(
+            target=target, stylesheets=[_STYLESHEET], font_config=_FONT_CONFIG, optimize_images=True
+        )
     except Exception as e:
         print(f"Error during PDF generation with WeasyPrint: {e}")
         raise
@@ -228,26 +297,26 @@ if __name__ == '__main__':
                 print("Pillow not installed, cannot create dummy logo. PDF will be generated without logo.")
                 logo_test_path = None # Set to None if logo cannot be created
 
-        pdf_bytes_invoice = create_pdf_summary_weasyprint(
-            sample_data_invoice,
-            doc_type="Invoice",
-            logo_path=logo_test_path
-        )
         with open("data/processed/invoice_summary_test.pdf", "wb") as f:
-            f.write(pdf_bytes_invoice)
+            create_pdf_summary_weasyprint(
+                sample_data_invoice,
+                doc_type="Invoice",
+                logo_path=logo_test_path,
+                target=f
+            )
         print("Sample invoice PDF generated successfully at data/processed/invoice_summary_test.pdf")
     except Exception as e:
         print(f"Failed to generate sample invoice PDF: {e}")
 
     print("\n--- Generating Sample Contract PDF ---")
     try:
-        pdf_bytes_contract = create_pdf_summary_weasyprint(
-            sample_data_contract,
-            doc_type="Contract",
-            logo_path=logo_test_path
-        )
         with open("data/processed/contract_summary_test.pdf", "wb") as f:
-            f.write(pdf_bytes_contract)
+            create_pdf_summary_weasyprint(
+                sample_data_contract,
+                doc_type="Contract",
+                logo_path=logo_test_path,
+                target=f
+            )
         print("Sample contract PDF generated successfully at data/processed/contract_summary_test.pdf")
     except Exception as e:
         print(f"Failed to generate sample contract PDF: {e}")
\ No newline at end of file
@@ -1,24 +1,22 @@
-def get_prompt_template(doc_type: str, document_text: str) -> str:
-    """
-    Returns an LLM prompt template tailored to the document type for information extraction.
+import functools
 
-    Args:
-        doc_type (str): The type of document ('invoice', 'contract', 'form', 'general').
-        document_text (str): The raw text extracted from the document.
+# Appended to the system instruction when the document is sent to the LLM in several parts
+_PARTIAL_EXTRACTION_NOTE = """
+        The text you receive is only one part of a longer document.
+        Extract only the fields that appear in this part and set all other fields to `null`.
+        """
 
-    Returns:
-        str: The formatted prompt string for the LLM.
-    """
+# Slot in every user template that is replaced with the document text
+DOCUMENT_TEXT_SLOT = "{document_text}"
 
-    if doc_type == "invoice":
-        prompt_template = f"""
+_INVOICE_INSTRUCTION = """
         You are an expert at extracting structured information from invoices.
         Your task is to extract the following entities from the provided invoice text and present them in a JSON format.
         Ensure the JSON is valid and complete. If a field is not found, set its value to `null`.
 
         Expected JSON Schema:
         ```json
-        {{
+        {
             "invoice_number": "string | null",
             "date": "string (YYYY-MM-DD format) | null",
             "vendor_name": "string | null",
@@ -26,34 +24,35 @@ def get_prompt_template(doc_type: str, document_text: str) -> str:
             "total_amount": "string (e.g., '123.45') | null",
             "currency": "string (e.g., 'USD', 'EUR') | null",
             "items": [
-                {{
+                {
                     "description": "string | null",
                     "quantity": "number | null",
                     "unit_price": "string (e.g., '10.00') | null",
                     "line_total": "string (e.g., '100.00') | null"
-                }}
+                }
             ],
             "payment_terms": "string | null",
             "summary": "A concise, one-sentence summary of the invoice, including vendor, total, and purpose."
-        }}
+        }
         ```
 
+        Please provide only the JSON output.
+        """
+_INVOICE_TEMPLATE = """
         Invoice Text:
         ---
         {document_text}
         ---
-
-        Please provide only the JSON output.
         """
-    elif doc_type == "contract":
-        prompt_template = f"""
+
+_CONTRACT_INSTRUCTION = """
         You are an expert at extracting key information and summarizing legal contracts.
         Your task is to extract the following entities from the provided contract text and present them in a JSON format.
         Ensure the JSON is valid and complete. If a field is not found, set its value to `null`.
 
         Expected JSON Schema:
         ```json
-        {{
+        {
             "contract_title": "string | null",
             "parties": "array of strings (names of parties involved) | null",
             "effective_date": "string (YYYY-MM-DD format) | null",
@@ -61,18 +60,19 @@ def get_prompt_template(doc_type: str, document_text: str) -> str:
             "governing_law": "string | null",
             "key_clauses_summary": "A brief summary (2-3 sentences) of the most important clauses (e.g., scope of work, payment terms, liability, intellectual property).",
             "overall_summary": "A one-paragraph overall summary of the contract's purpose, main agreements, and duration."
-        }}
+        }
         ```
 
+        Please provide only the JSON output.
+        """
+_CONTRACT_TEMPLATE = """
         Contract Text:
         ---
         {document_text}
         ---
-
-        Please provide only the JSON output.
         """
-    elif doc_type == "form":
-        prompt_template = f"""
+
+_FORM_INSTRUCTION = """
         You are an expert at extracting information from various forms.
         Your task is to extract key fields from the provided form text and present them in a JSON format.
         Identify common form fields like Name, Address, Phone, Email, Date of Birth, etc., along with any specific fields
@@ -81,7 +81,7 @@ def get_prompt_template(doc_type: str, document_text: str) -> str:
 
         Expected JSON Schema (adapt based on detected fields):
         ```json
-        {{
+        {
             "form_type": "string (e.g., 'Application Form', 'Registration Form') | null",
             "applicant_name": "string | null",
             "address": "string | null",
@@ -90,19 +90,20 @@ def get_prompt_template(doc_type: str, document_text: str) -> str:
             "date_of_birth": "string (YYYY-MM-DD format) | null",
             "purpose_of_form": "string | null",
             "summary": "A concise summary of the form's content and purpose."
-        }}
+        }
         ```
         Adapt the fields in the JSON schema based on the content of the form.
 
+        Please provide only the JSON output.
+        """
+_FORM_TEMPLATE = """
         Form Text:
         ---
         {document_text}
         ---
-
-        Please provide only the JSON output.
         """
-    else: # General document analysis
-        prompt_template = f"""
+
+_GENERAL_INSTRUCTION = """
         You are a highly intelligent assistant capable of understanding and summarizing any document.
         Your task is to extract the most important entities and provide a concise summary from the provided text.
         Present the extracted information and summary in a JSON format.
@@ -110,23 +111,71 @@ def get_prompt_template(doc_type: str, document_text: str) -> str:
 
         Expected JSON Schema:
         ```json
-        {{
+        {
             "document_main_topic": "string | null",
             "key_entities": "array of strings (important names, places, dates, concepts) | null",
             "main_points": "array of strings (bullet points of key takeaways) | null",
             "overall_summary": "A one-paragraph comprehensive summary of the document's content and purpose."
-        }}
+        }
         ```
 
+        Please provide only the JSON output.
+        """
+_GENERAL_TEMPLATE = """
         Document Text:
         ---
         {document_text}
         ---
-
-        Please provide only the JSON output.
         """
-    
-    return prompt_template
+
+# doc_type -> (system instruction, user template); anything else gets the general prompt
+_TEMPLATES = {
+    "invoice": (_INVOICE_INSTRUCTION, _INVOICE_TEMPLATE),
+    "contract": (_CONTRACT_INSTRUCTION, _CONTRACT_TEMPLATE),
+    "form": (_FORM_INSTRUCTION, _FORM_TEMPLATE),
+    "general": (_GENERAL_INSTRUCTION, _GENERAL_TEMPLATE),
+}
+
+@functools.lru_cache(maxsize=8)
+def get_prompt_template(doc_type: str, partial: bool = False) -> tuple[str, str]:
+    """
+    Returns an LLM prompt template tailored to the document type for information extraction.
+
+    The prompt is split into a static system instruction, which depends only on the
+    document type and can be reused (and prefix-cached) across requests, and a user
+    template whose `{document_text}` slot the caller fills with `fill_prompt`.
+    The templates are module-level constants, so nothing is rebuilt per call.
+
+    Args:
+        doc_type (str): The type of document ('invoice', 'contract', 'form', 'general').
+        partial (bool): Whether the document text will be one chunk of a larger document.
+
+    Returns:
+        tuple[str, str]: The system instruction and the user content template for the LLM.
+    """
+    system_instruction, user_template = _TEMPLATES.get(doc_type, _TEMPLATES["general"])
+
+    if partial:
+        system_instruction += _PARTIAL_EXTRACTION_NOTE
+
+    return system_instruction, user_template
+
+@functools.lru_cache(maxsize=8)
+def _split_template(user_template: str) -> tuple[str, str]:
+    """Splits a user template into the constant text before and after its document text slot."""
+    prefix, _, suffix = user_template.partition(DOCUMENT_TEXT_SLOT)
+    return prefix, suffix
+
+def fill_prompt(user_template: str, document_text: str) -> str:
+    """
+    Inserts the document text into a user template returned by `get_prompt_template`.
+
+    The template's constant prefix and suffix are split out once, so building a prompt
+    (including on retries) is a single join without rescanning the template. Prompts
+    themselves are not cached, since they are as large as the documents.
+    """
+    prefix, suffix = _split_template(user_template)
+    return "".join((prefix, document_text, suffix))
 
 if __name__ == '__main__':
     # Example usage
@@ -141,8 +190,10 @@ if __name__ == '__main__':
     Total: $5000.00 USD
     Payment Terms: Net 30
     """
-    invoice_prompt = get_prompt_template("invoice", sample_invoice_text)
+    invoice_system, invoice_template = get_prompt_template("invoice")
+    invoice_prompt = fill_prompt(invoice_template, sample_invoice_text)
     print("--- Invoice Prompt ---")
+    print(invoice_system)
     print(invoice_prompt)
 
     sample_contract_text = """
@@ -152,14 +203,18 @@ if __name__ == '__main__':
     Governing Law: California
     Scope of Work: Design and development of a new website.
     """
-    contract_prompt = get_prompt_template("contract", sample_contract_text)
+    contract_system, contract_template = get_prompt_template("contract")
+    contract_prompt = fill_prompt(contract_template, sample_contract_text)
     print("\n--- Contract Prompt ---")
+    print(contract_system)
     print(contract_prompt)
 
     sample_general_text = """
     The quick brown fox jumps over the lazy dog. This is a test document.
     It contains some random information for general analysis.
     """
-    general_prompt = get_prompt_template("general", sample_general_text)
+    general_system, general_template = get_prompt_template("general")
+    general_prompt = fill_prompt(general_template, sample_general_text)
     print("\n--- General Document Prompt ---")
+    print(general_system)
     print(general_prompt)
\ No newline at end of file
@@ -0,0 +1,6 @@
+import sys
+import pathlib
+
+# Make the project root importable (for `core.*`) once for the whole test session,
+# instead of every test module patching sys.path itself
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
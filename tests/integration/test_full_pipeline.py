@@ -4,10 +4,6 @@ import json
 import shutil
 from unittest.mock import patch, MagicMock
 
-# Assuming core modules are correctly in PYTHONPATH
-import sys
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-
 from core.document_parser import analyze_document_pipeline
 from core.ocr_engine import extract_text_from_document
 from core.llm_client import get_llm_response
@@ -54,8 +50,7 @@ class TestFullPipeline(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         """Clean up dummy files and directories."""
-        if os.path.exists(cls.test_dir):
-            shutil.rmtree(cls.test_dir)
+        shutil.rmtree(cls.test_dir, ignore_errors=True)
 
     @patch('core.llm_client.get_llm_response')
     @patch('core.ocr_engine.extract_text_from_document')
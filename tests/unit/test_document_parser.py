@@ -0,0 +1,171 @@
+import unittest
+import sys
+import asyncio
+from unittest.mock import patch, MagicMock
+
+from core.document_parser import (
+    _merge_extractions, analyze_streaming, analyze_documents_pipeline, analyze_documents_async,
+    detect_doc_type, MAX_INPUT_TOKENS
+)
+from core.llm_client import parse_llm_json
+
+def _fake_pages(pages):
+    """Returns a stand-in for iter_page_texts that yields the given page texts."""
+    async def iter_pages(file_path):
+        for page in pages:
+            yield page
+    return iter_pages
+
+class TestDocumentParser(unittest.TestCase):
+
+    def test_detect_doc_type(self):
+        """Test keyword-based document type detection, including case-folded OCR text."""
+        cases = {
+            "Invoice #123, see the terms and conditions": "invoice",
+            "This Agreement is made between": "contract",
+            "Application Form": "form",
+            "Meeting notes": "general",
+            "\u0130nvoice": "invoice", # Dotted capital I, which .lower() does not map back to "invoice"
+            "Term\u017f and condition\u017f": "contract", # Long s
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(detect_doc_type(text), expected)
+
+    def test_merge_extractions_null_items(self):
+        """Test that partials reporting 'items' as null merge with partials that return a list."""
+        items = [{"description": "Item A"}, {"description": "Item B"}]
+        cases = {
+            "null_then_list": [{"items": None}, {"items": items}],
+            "list_then_null": [{"items": items}, {"items": None}],
+        }
+        for name, partials in cases.items():
+            with self.subTest(case=name):
+                self.assertEqual(_merge_extractions(partials)["items"], items)
+
+    def test_merge_extractions_fields(self):
+        """Test that items are concatenated and other fields keep the first non-empty value."""
+        partials = [
+            {"invoice_number": None, "items": [{"description": "Item A"}]},
+            {"invoice_number": "INV-1", "items": [{"description": "Item B"}]},
+            {"invoice_number": "INV-2", "items": []},
+        ]
+        merged = _merge_extractions(partials)
+        self.assertEqual(merged["invoice_number"], "INV-1")
+        self.assertEqual(merged["items"], [{"description": "Item A"}, {"description": "Item B"}])
+
+    @patch('core.document_parser.get_llm_response', return_value={"summary": "Full document."})
+    def test_streaming_single_request_within_budget(self, mock_get_llm_response):
+        """Test that a document within the token budget is sent in one full-prompt request."""
+        pages = ["Invoice page text. " * 600] * 3 # ~34k characters, well under MAX_INPUT_TOKENS
+        with patch('core.document_parser.iter_page_texts', _fake_pages(pages)):
+            results = asyncio.run(analyze_streaming("doc.pdf", "dummy_key", "gemini"))
+
+        mock_get_llm_response.assert_called_once()
+        self.assertIn("\n".join(pages), mock_get_llm_response.call_args.args[0])
+        self.assertEqual(results["extracted_data"], {"summary": "Full document."})
+
+    @patch('core.document_parser.get_llm_response', return_value={"items": None})
+    def test_streaming_chunks_over_budget(self, mock_get_llm_response):
+        """Test that a document over the token budget is analyzed in several partial requests."""
+        pages = ["x" * 50_000] * (MAX_INPUT_TOKENS * 4 // 50_000 + 2)
+        with patch('core.document_parser.iter_page_texts', _fake_pages(pages)):
+            asyncio.run(analyze_streaming("doc.pdf", "dummy_key", "gemini"))
+
+        self.assertGreater(mock_get_llm_response.call_count, 1)
+
+    @patch('core.document_parser.get_llm_response', side_effect=RuntimeError("Test API error"))
+    def test_streaming_reraises_errors(self, mock_get_llm_response):
+        """Test that LLM errors reach the caller instead of producing an empty result."""
+        with patch('core.document_parser.iter_page_texts', _fake_pages(["Some text."])):
+            with self.assertRaises(RuntimeError):
+                asyncio.run(analyze_streaming("doc.pdf", "dummy_key", "gemini"))
+
+    @patch('core.document_parser.get_llm_responses')
+    @patch('core.document_parser.extract_text_from_document')
+    def test_documents_pipeline(self, mock_extract_text, mock_get_llm_responses):
+        """Test the batch pipeline: sequential OCR, one batched LLM call, per-document failures isolated."""
+        texts = {"a.pdf": "Invoice A", "b.png": "", "c.pdf": "Agreement C"}
+        def extract(file_path):
+            if file_path == "bad.pdf":
+                raise RuntimeError("Test OCR error")
+            return texts[file_path]
+        mock_extract_text.side_effect = extract
+        mock_get_llm_responses.return_value = ['{"invoice_number": "A"}', '```json\n{"contract_title": "C"}\n```']
+
+        results = analyze_documents_pipeline(["a.pdf", "b.png", "bad.pdf", "c.pdf"], "dummy_key", "gemini")
+
+        self.assertEqual([call.args[0] for call in mock_extract_text.call_args_list], ["a.pdf", "b.png", "bad.pdf", "c.pdf"])
+        mock_get_llm_responses.assert_called_once()
+        self.assertEqual(len(mock_get_llm_responses.call_args.args[0]), 2) # Only the documents with text
+        self.assertEqual([r["extracted_data"] for r in results],
+                         [{"invoice_number": "A"}, {}, {}, {"contract_title": "C"}])
+        self.assertEqual(results[3]["main_fields"], {"contract_title": "C"})
+
+    @patch('core.document_parser.get_llm_responses')
+    @patch('core.document_parser.extract_text_from_document', side_effect=lambda file_path: f"Invoice {file_path}")
+    def test_documents_pipeline_non_object_output(self, mock_extract_text, mock_get_llm_responses):
+        """Test that an LLM output that is valid JSON but not an object only fails its own document."""
+        mock_get_llm_responses.return_value = ['[{"invoice_number": "A"}]', '{"invoice_number": "B"}', 'null']
+
+        results = analyze_documents_pipeline(["a.pdf", "b.pdf", "c.pdf"], "dummy_key", "gemini")
+
+        self.assertEqual([r["extracted_data"] for r in results], [{}, {"invoice_number": "B"}, {}])
+        self.assertEqual([r["main_fields"] for r in results], [None, {"invoice_number": "B"}, None])
+
+    @patch('core.document_parser.get_llm_response')
+    @patch('core.document_parser.extract_text_from_document')
+    def test_documents_async(self, mock_extract_text, mock_get_llm_response):
+        """Test the staged async pipeline: results in input order, failures isolated, PDFs for analyzed documents."""
+        texts = {"a.pdf": "Invoice A", "b.png": "", "c.pdf": "Agreement C"}
+        def extract(file_path):
+            if file_path == "bad.pdf":
+                raise RuntimeError("Test OCR error")
+            return texts[file_path]
+        mock_extract_text.side_effect = extract
+        mock_get_llm_response.side_effect = lambda prompt, *args, **kwargs: (
+            {"invoice_number": "A"} if "Invoice A" in prompt else {"contract_title": "C"}
+        )
+        # The PDF stage imports the generator lazily; stand in for it so WeasyPrint isn't needed
+        pdf_generator = MagicMock()
+        pdf_generator.create_pdf_summary_weasyprint.return_value = b"dummy_pdf_content"
+
+        with patch.dict(sys.modules, {'core.pdf_generator': pdf_generator}):
+            results = asyncio.run(analyze_documents_async(
+                ["a.pdf", "b.png", "bad.pdf", "c.pdf"], "dummy_key", "gemini", generate_pdf=True, llm_concurrency=2
+            ))
+
+        self.assertEqual([r["extracted_data"] for r in results],
+                         [{"invoice_number": "A"}, {}, {}, {"contract_title": "C"}])
+        self.assertEqual(mock_get_llm_response.call_count, 2)
+        self.assertEqual([r.get("pdf_bytes") for r in results], [b"dummy_pdf_content", None, None, b"dummy_pdf_content"])
+        self.assertIsNone(results[2]["main_fields"])
+
+    @patch('core.document_parser.transform_llm_output_to_dataframe')
+    @patch('core.document_parser.get_llm_response')
+    @patch('core.document_parser.extract_text_from_document', side_effect=lambda file_path: f"Invoice {file_path}")
+    def test_documents_async_bad_output(self, mock_extract_text, mock_get_llm_response, mock_transform):
+        """Test that a non-object LLM output or a failed transformation only fails its own document."""
+        responses = {
+            "a.pdf": '[{"invoice_number": "A"}]', # Valid JSON, but not an object
+            "b.pdf": '{"invoice_number": "B"}',
+            "c.pdf": '{"invoice_number": "C"}', # Transformation fails
+        }
+        def llm_response(prompt, *args, parse=False, **kwargs):
+            text = next(text for file_path, text in responses.items() if file_path in prompt)
+            return parse_llm_json(text) if parse else text
+        mock_get_llm_response.side_effect = llm_response
+        def transform(extracted_data):
+            if extracted_data["invoice_number"] == "C":
+                raise AttributeError("Test transformation error")
+            return extracted_data, None, ""
+        mock_transform.side_effect = transform
+
+        results = asyncio.run(analyze_documents_async(["a.pdf", "b.pdf", "c.pdf"], "dummy_key", "gemini",
+                                                      llm_concurrency=1))
+
+        self.assertEqual([r["extracted_data"] for r in results], [{}, {"invoice_number": "B"}, {}])
+        self.assertEqual([r["main_fields"] for r in results], [None, {"invoice_number": "B"}, None])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,27 +1,48 @@
 import unittest
 import os
 import json
+from types import SimpleNamespace
 from unittest.mock import patch, MagicMock
 from dotenv import load_dotenv
 
-# Assuming core.llm_client is in the parent directory or correctly in PYTHONPATH
-import sys
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from core.llm_client import get_llm_response
+from core.llm_client import get_llm_response, get_llm_responses, _get_gemini_client, parse_llm_json, clear_cache
+
+# Canned API responses shared by the success-path tests; plain namespaces are enough for the
+# attribute access the client does and are much cheaper to build than MagicMock trees
+try:
+    # openai is optional (not in requirements.txt); when installed, use its real response model
+    from openai.types import CompletionUsage
+    from openai.types.chat import ChatCompletion, ChatCompletionMessage
+    from openai.types.chat.chat_completion import Choice
+    _CANNED_OPENAI_RESPONSE = ChatCompletion(
+        id="1", object="chat.completion", created=0, model="gpt-3.5-turbo-0125",
+        choices=[Choice(index=0, finish_reason="stop",
+                        message=ChatCompletionMessage(role="assistant", content='{"key": "value"}'))],
+        usage=CompletionUsage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+    )
+except ImportError:
+    _CANNED_OPENAI_RESPONSE = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='{"key": "value"}'))])
+_CANNED_GEMINI_RESPONSE = SimpleNamespace(text='{"key": "value"}')
 
 class TestLLMClient(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        load_dotenv() # Load API keys from .env for actual API calls if needed
+        # Load API keys from .env for actual API calls if needed, unless they are already exported
+        if not any(k in os.environ for k in ("OPENAI_API_KEY", "GOOGLE_API_KEY")):
+            load_dotenv()
+
+    def setUp(self):
+        clear_cache() # Every test should reach the (mocked) API
+        _get_gemini_client.cache_clear() # ...and build its client from the patched SDK
+
+    def tearDown(self):
+        _get_gemini_client.cache_clear() # Don't leak clients built from mocks into other tests
 
     @patch('openai.chat.completions.create')
     def test_openai_client_success(self, mock_create):
         """Test successful response from OpenAI client."""
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message.content = '{"key": "value"}'
-        mock_create.return_value = mock_response
+        mock_create.return_value = _CANNED_OPENAI_RESPONSE
 
         prompt = "Extract data."
         api_key = "dummy_openai_key"
@@ -61,7 +82,7 @@ class TestLLMClient(unittest.TestCase):
     #     response = get_llm_response(prompt, api_key, provider="gemini")
         
     #     self.assertEqual(response, '{"gemini_key": "gemini_value"}')
-    #     mock_generative_model.assert_called_once_with(model_name="gemini-1.5-flash")
+    #     mock_generative_model.assert_called_once_with(model_name="gemini-1.5-flash", system_instruction=None)
     #     mock_instance.generate_content.assert_called_once_with(
     #         prompt,
     #         generation_config={
@@ -70,21 +91,155 @@ class TestLLMClient(unittest.TestCase):
     #         }
     #     )
 
-    def test_unsupported_provider(self):
-        """Test handling of unsupported LLM providers."""
-        prompt = "Some text."
-        api_key = "some_key"
-        with self.assertRaises(ValueError) as cm:
-            get_llm_response(prompt, api_key, provider="unsupported")
-        self.assertIn("Unsupported LLM provider", str(cm.exception))
-
-    def test_missing_api_key(self):
-        """Test handling of missing API key."""
-        prompt = "Some text."
-        api_key = None
-        with self.assertRaises(ValueError) as cm:
-            get_llm_response(prompt, api_key, provider="openai")
-        self.assertIn("API key is missing", str(cm.exception))
+    @patch('core.llm_client.glm.GenerativeServiceClient')
+    @patch('google.generativeai.GenerativeModel')
+    def test_gemini_client_reused_across_calls(self, mock_generative_model, mock_service_client):
+        """Test that the Gemini client is built once and reused for repeated calls."""
+        mock_generative_model.return_value.generate_content.return_value = _CANNED_GEMINI_RESPONSE
+
+        for i in range(3):
+            response = get_llm_response(f"Extract data {i}.", "dummy_gemini_key", provider="gemini")
+            self.assertEqual(response, '{"key": "value"}')
+
+        mock_service_client.assert_called_once_with(client_options={"api_key": "dummy_gemini_key"})
+        mock_generative_model.assert_called_once_with(model_name="gemini-1.5-flash", system_instruction=None)
+        self.assertEqual(mock_generative_model.return_value.generate_content.call_count, 3)
+
+    @patch('core.llm_client.glm.GenerativeServiceClient',
+           side_effect=lambda client_options: SimpleNamespace(api_key=client_options["api_key"]))
+    def test_gemini_client_bound_to_its_api_key(self, mock_service_client):
+        """Test that each cached model keeps the API key it was built for, whatever key is used later."""
+        model_a = _get_gemini_client("key_a", "gemini-1.5-flash")
+        model_b = _get_gemini_client("key_b", "gemini-1.5-flash")
+
+        self.assertIs(_get_gemini_client("key_a", "gemini-1.5-flash"), model_a)
+        self.assertEqual(model_a._client.api_key, "key_a")
+        self.assertEqual(model_b._client.api_key, "key_b")
+
+    @patch('core.llm_client.glm.GenerativeServiceClient')
+    @patch('google.generativeai.GenerativeModel')
+    def test_gemini_response_cache(self, mock_generative_model, mock_service_client):
+        """Test that an identical request is answered from the cache until it is cleared."""
+        mock_generative_model.return_value.generate_content.return_value = _CANNED_GEMINI_RESPONSE
+
+        for _ in range(3):
+            response = get_llm_response("Extract data.", "dummy_gemini_key", provider="gemini")
+            self.assertEqual(response, '{"key": "value"}')
+        get_llm_responses(["Extract data.", "Other data."], "dummy_gemini_key", provider="gemini")
+        self.assertEqual(mock_generative_model.return_value.generate_content.call_count, 2)
+
+        clear_cache()
+        get_llm_response("Extract data.", "dummy_gemini_key", provider="gemini")
+        self.assertEqual(mock_generative_model.return_value.generate_content.call_count, 3)
+
+    @patch('core.llm_client.glm.GenerativeServiceClient')
+    @patch('google.generativeai.GenerativeModel')
+    def test_gemini_response_cache_skips_invalid_json(self, mock_generative_model, mock_service_client):
+        """Test that a malformed response is not cached, so a retry reaches the API again."""
+        generate_content = mock_generative_model.return_value.generate_content
+        cases = {
+            "single": lambda: get_llm_response("Extract data.", "dummy_gemini_key", provider="gemini", parse=True),
+            "batch": lambda: get_llm_responses(["Extract data."], "dummy_gemini_key", provider="gemini", parse=True)[0],
+        }
+        for name, request in cases.items():
+            with self.subTest(case=name):
+                clear_cache()
+                generate_content.reset_mock()
+                generate_content.side_effect = [SimpleNamespace(text='{"key": "val'), _CANNED_GEMINI_RESPONSE]
+
+                with self.assertRaises(json.JSONDecodeError):
+                    request()
+                self.assertEqual(request(), {"key": "value"}) # The retry gets a fresh response
+                self.assertEqual(request(), {"key": "value"}) # ...which is cached
+                self.assertEqual(generate_content.call_count, 2)
+
+    @patch('core.llm_client._RESPONSE_CACHE_SIZE', 2)
+    @patch('core.llm_client.glm.GenerativeServiceClient')
+    @patch('google.generativeai.GenerativeModel')
+    def test_gemini_response_cache_bounded(self, mock_generative_model, mock_service_client):
+        """Test that the response cache evicts the least recently used entry and is keyed per API key."""
+        mock_generative_model.return_value.generate_content.return_value = _CANNED_GEMINI_RESPONSE
+        generate_content = mock_generative_model.return_value.generate_content
+
+        for prompt in ("Prompt A", "Prompt B", "Prompt A", "Prompt C"): # C evicts B, the least recently used
+            get_llm_response(prompt, "dummy_gemini_key", provider="gemini")
+        self.assertEqual(generate_content.call_count, 3)
+        get_llm_response("Prompt A", "dummy_gemini_key", provider="gemini")
+        self.assertEqual(generate_content.call_count, 3)
+        get_llm_response("Prompt B", "dummy_gemini_key", provider="gemini")
+        self.assertEqual(generate_content.call_count, 4)
+
+        get_llm_response("Prompt B", "other_gemini_key", provider="gemini")
+        self.assertEqual(generate_content.call_count, 5)
+
+    @patch('core.llm_client.glm.GenerativeServiceClient')
+    @patch('google.generativeai.GenerativeModel')
+    def test_gemini_client_parse_json(self, mock_generative_model, mock_service_client):
+        """Test that parse=True returns the response already parsed as JSON."""
+        mock_generative_model.return_value.generate_content.return_value = _CANNED_GEMINI_RESPONSE
+
+        response = get_llm_response("Extract data.", "dummy_gemini_key", provider="gemini", parse=True)
+
+        self.assertEqual(response, {"key": "value"})
+
+    @patch('core.llm_client.glm.GenerativeServiceClient')
+    @patch('google.generativeai.GenerativeModel')
+    def test_gemini_batch_preserves_order(self, mock_generative_model, mock_service_client):
+        """Test that batched Gemini responses come back in prompt order."""
+        mock_generative_model.return_value.generate_content.side_effect = (
+            lambda prompt, generation_config: MagicMock(text=f'{{"prompt": "{prompt}"}}')
+        )
+
+        prompts = [f"Prompt {i}" for i in range(10)]
+        responses = get_llm_responses(prompts, "dummy_gemini_key", provider="gemini")
+
+        self.assertEqual(responses, [f'{{"prompt": "{p}"}}' for p in prompts])
+        mock_generative_model.assert_called_once_with(model_name="gemini-1.5-flash", system_instruction=None)
+
+    def test_parse_llm_json_from_wrapped_output(self):
+        """Test that JSON wrapped in code fences or commentary is still recovered."""
+        self.assertEqual(parse_llm_json('{"key": "value"}'), {"key": "value"})
+        self.assertEqual(parse_llm_json('```json\n{"key": "value"}\n```'), {"key": "value"})
+        self.assertEqual(parse_llm_json('Here is the data: {"key": {"nested": 1}} Hope this helps!'),
+                         {"key": {"nested": 1}})
+
+    def test_parse_llm_json_invalid_output(self):
+        """Test that unrecoverable output raises a JSONDecodeError carrying the full response."""
+        with self.assertRaises(json.JSONDecodeError) as cm:
+            parse_llm_json("This is not valid JSON. {broken")
+        self.assertEqual(cm.exception.doc, "This is not valid JSON. {broken")
+
+    def test_parse_llm_json_non_object(self):
+        """Test that valid JSON other than an object is rejected like unparseable output."""
+        for text in ('[{"key": "value"}]', '[1, 2]', '"text"', '42', 'null'):
+            with self.subTest(text=text):
+                with self.assertRaises(json.JSONDecodeError) as cm:
+                    parse_llm_json(text)
+                self.assertEqual(cm.exception.doc, text)
+
+    def test_invalid_request_arguments(self):
+        """Test handling of unsupported LLM providers and missing API keys, one sub-test per case."""
+        cases = {
+            "unsupported_provider": ("some_key", "unsupported", "Unsupported LLM provider"),
+            "missing_api_key": (None, "openai", "API key is missing"),
+        }
+        for name, (api_key, provider, message) in cases.items():
+            with self.subTest(case=name):
+                with self.assertRaises(ValueError) as cm:
+                    get_llm_response("Some text.", api_key, provider=provider)
+                self.assertIn(message, str(cm.exception))
+
+    def test_disabled_openai_provider(self):
+        """Test that the disabled OpenAI provider raises instead of returning None, also in a batch."""
+        requests = {
+            "single": lambda: get_llm_response("Some text.", "some_key", provider="openai"),
+            "batch": lambda: get_llm_responses(["Some text.", "More text."], "some_key", provider="openai"),
+        }
+        for name, request in requests.items():
+            with self.subTest(case=name):
+                with self.assertRaises(ValueError) as cm:
+                    request()
+                self.assertIn("OpenAI provider is currently disabled", str(cm.exception))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,106 +1,235 @@
 import unittest
 import os
+import io
+import shutil
+import tempfile
+import hashlib
+import functools
 from PIL import Image, ImageDraw, ImageFont
 import fitz # PyMuPDF
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 
-# Assuming core.ocr_engine is in the parent directory or correctly in PYTHONPATH
-# For local testing, you might need to adjust sys.path
-import sys
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from core.ocr_engine import extract_text_from_document
+from core.ocr_engine import (
+    extract_text_from_document, clear_ocr_cache, _ocr_executor, _ocr_mp_context, _render_page, RENDER_DPI,
+    _preprocess_for_ocr, cv2
+)
+
+@functools.lru_cache(maxsize=None)
+def _font(size):
+    """Returns Arial at the given size (or Pillow's default font), probing the font file only once."""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except IOError:
+        return ImageFont.load_default()
+
+# Everything the fixtures are generated from; the cache directory is keyed on a hash of these,
+# so changing any of them regenerates the fixtures instead of reusing stale ones
+_FIXTURE_PARAMS = {
+    "image": {"size": (400, 200), "text": "Test OCR Image", "position": (50, 50), "font_size": 24},
+    "selectable_pdf": {"text": "This is selectable text in PDF.", "position": (50, 50), "font_size": 12},
+    "scanned_pdf": {"size": (600, 400), "text": "Scanned PDF Text", "position": (100, 100), "font_size": 30},
+    "versions": (Image.__version__, fitz.VersionBind),
+}
+
+def _fixture_dir():
+    """Returns the directory the fixtures are cached in across test runs."""
+    key = hashlib.sha256(repr(sorted(_FIXTURE_PARAMS.items())).encode()).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"test_ocr_fixtures_{key}")
+
+def _save_atomically(path, save):
+    """Saves a fixture via `save(tmp_path)` under a temporary name, then moves it into place."""
+    # A concurrent or aborted run can then never see, or leave behind, a half-written fixture
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        save(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def _ensure_fixtures():
+    """Creates the dummy image and PDFs used by the tests, unless a previous run already did, and returns their paths."""
+    fixture_dir = _fixture_dir()
+    image_path = os.path.join(fixture_dir, "test_image.png")
+    pdf_selectable_path = os.path.join(fixture_dir, "test_selectable_pdf.pdf")
+    pdf_scanned_path = os.path.join(fixture_dir, "test_scanned_pdf.pdf")
+    paths = (image_path, pdf_selectable_path, pdf_scanned_path)
+    # Every file is moved into place only once complete, so existing files are usable
+    if all(os.path.exists(p) for p in paths):
+        return paths
+    os.makedirs(fixture_dir, exist_ok=True)
+
+    # Create a dummy image file
+    params = _FIXTURE_PARAMS["image"]
+    img = Image.new('RGB', params["size"], color = (255, 255, 255))
+    d = ImageDraw.Draw(img)
+    d.text(params["position"], params["text"], fill=(0,0,0), font=_font(params["font_size"]))
+    _save_atomically(image_path, lambda tmp_path: img.save(tmp_path, "PNG"))
+
+    # Create a dummy PDF file (selectable text). Both PDFs are built from one document,
+    # saved without compression or garbage collection since they are throwaway fixtures.
+    params = _FIXTURE_PARAMS["selectable_pdf"]
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text(params["position"], params["text"], fontsize=params["font_size"])
+    _save_atomically(pdf_selectable_path, lambda tmp_path: doc.save(tmp_path, garbage=0, deflate=False))
+    doc.delete_page(0)
+
+    # Create a dummy scanned PDF (image-based PDF, requires OCR fallback)
+    # For a true "scanned" PDF, we'd embed an image.
+    # For simplicity, we'll create a PDF where direct text extraction is empty
+    # and rely on the OCR fallback.
+    # (Note: PyMuPDF's get_text() usually returns something even from image-only if OCR is run by it.
+    # This test relies on the `extract_text_from_document`'s logic to try direct then OCR).
+
+    # A more realistic "scanned" PDF simulation:
+    params = _FIXTURE_PARAMS["scanned_pdf"]
+    img_for_pdf = Image.new('RGB', params["size"], color = (255, 255, 255))
+    d_img = ImageDraw.Draw(img_for_pdf)
+    d_img.text(params["position"], params["text"], fill=(0,0,0), font=_font(params["font_size"]))
+    # The PNG is embedded straight from memory rather than through a temporary file
+    img_buffer = io.BytesIO()
+    img_for_pdf.save(img_buffer, "PNG")
+
+    img_page = doc.new_page(width=img_for_pdf.width, height=img_for_pdf.height)
+    img_page.insert_image(img_page.rect, stream=img_buffer.getvalue())
+    _save_atomically(pdf_scanned_path, lambda tmp_path: doc.save(tmp_path, garbage=0, deflate=False))
+    doc.close()
+    return paths
 
 class TestOCREngine(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
         """Set up dummy files for testing."""
-        cls.test_dir = "test_data"
-        os.makedirs(cls.test_dir, exist_ok=True)
-
-        # Create a dummy image file
-        cls.image_path = os.path.join(cls.test_dir, "test_image.png")
-        img = Image.new('RGB', (400, 200), color = (255, 255, 255))
-        d = ImageDraw.Draw(img)
-        try:
-            font = ImageFont.truetype("arial.ttf", 24)
-        except IOError:
-            font = ImageFont.load_default()
-        d.text((50,50), "Test OCR Image", fill=(0,0,0), font=font)
-        img.save(cls.image_path)
-
-        # Create a dummy PDF file (selectable text)
-        cls.pdf_selectable_path = os.path.join(cls.test_dir, "test_selectable_pdf.pdf")
-        doc = fitz.open()
-        page = doc.new_page()
-        page.insert_text((50, 50), "This is selectable text in PDF.", fontsize=12)
-        doc.save(cls.pdf_selectable_path)
-        doc.close()
-
-        # Create a dummy scanned PDF (image-based PDF, requires OCR fallback)
-        cls.pdf_scanned_path = os.path.join(cls.test_dir, "test_scanned_pdf.pdf")
-        # For a true "scanned" PDF, we'd embed an image.
-        # For simplicity, we'll create a PDF where direct text extraction is empty
-        # and rely on the OCR fallback.
-        # (Note: PyMuPDF's get_text() usually returns something even from image-only if OCR is run by it.
-        # This test relies on the `extract_text_from_document`'s logic to try direct then OCR).
-        
-        # A more realistic "scanned" PDF simulation:
-        img_for_pdf = Image.new('RGB', (600, 400), color = (255, 255, 255))
-        d_img = ImageDraw.Draw(img_for_pdf)
-        try:
-            font_img = ImageFont.truetype("arial.ttf", 30)
-        except IOError:
-            font_img = ImageFont.load_default()
-        d_img.text((100,100), "Scanned PDF Text", fill=(0,0,0), font=font_img)
-        img_for_pdf.save(os.path.join(cls.test_dir, "temp_scanned_img.png"))
-        
-        doc_scanned = fitz.open()
-        img_page = doc_scanned.new_page(width=img_for_pdf.width, height=img_for_pdf.height)
-        img_page.insert_image(img_page.rect, filename=os.path.join(cls.test_dir, "temp_scanned_img.png"))
-        doc_scanned.save(cls.pdf_scanned_path)
-        doc_scanned.close()
-
+        # Keep each Tesseract single-threaded so the concurrent extractions below don't oversubscribe
+        # the CPU; scoped to this class and restored in tearDownClass
+        cls.env_patch = patch.dict(os.environ, {"OMP_THREAD_LIMIT": os.environ.get("OMP_THREAD_LIMIT", "1")})
+        cls.env_patch.start()
+        # The fixtures are deterministic, so they are generated once and reused across test runs
+        cls.image_path, cls.pdf_selectable_path, cls.pdf_scanned_path = _ensure_fixtures()
+        # Files the tests write themselves go in a scratch directory of this run
+        cls.test_dir = tempfile.mkdtemp(prefix="test_ocr_")
+        # Run all extractions at once so their Tesseract runs overlap; each test checks its own result.
+        # They finish before any test starts, so no extraction sees a test's patches.
+        with ThreadPoolExecutor() as executor:
+            cls.extractions = {
+                path: executor.submit(extract_text_from_document, path)
+                for path in (cls.image_path, cls.pdf_selectable_path, cls.pdf_scanned_path)
+            }
 
     @classmethod
     def tearDownClass(cls):
-        """Clean up dummy files after testing."""
-        if os.path.exists(cls.image_path):
-            os.remove(cls.image_path)
-        if os.path.exists(cls.pdf_selectable_path):
-            os.remove(cls.pdf_selectable_path)
-        if os.path.exists(cls.pdf_scanned_path):
-            os.remove(cls.pdf_scanned_path)
-        if os.path.exists(os.path.join(cls.test_dir, "temp_scanned_img.png")):
-            os.remove(os.path.join(cls.test_dir, "temp_scanned_img.png"))
-        if os.path.exists(cls.test_dir):
-            os.rmdir(cls.test_dir)
+        """Clean up the scratch files and restore the environment; the cached fixtures are kept."""
+        shutil.rmtree(cls.test_dir, ignore_errors=True)
+        cls.env_patch.stop()
 
     def test_extract_text_from_image(self):
         """Test text extraction from an image."""
-        extracted_text = extract_text_from_document(self.image_path)
+        extracted_text = self.extractions[self.image_path].result()
         self.assertIn("Test OCR Image", extracted_text)
 
     def test_extract_text_from_selectable_pdf(self):
         """Test text extraction from a PDF with selectable text."""
-        extracted_text = extract_text_from_document(self.pdf_selectable_path)
+        extracted_text = self.extractions[self.pdf_selectable_path].result()
         self.assertIn("This is selectable text in PDF.", extracted_text)
 
     def test_extract_text_from_scanned_pdf(self):
         """Test text extraction from a scanned (image-based) PDF."""
         # This test relies on Tesseract's ability to OCR the embedded image in the PDF.
-        extracted_text = extract_text_from_document(self.pdf_scanned_path)
+        extracted_text = self.extractions[self.pdf_scanned_path].result()
         self.assertIn("Scanned PDF Text", extracted_text)
 
+    @patch('core.ocr_engine.pytesseract.image_to_string', return_value="Cached OCR Text")
+    def test_image_ocr_cached_by_content(self, mock_image_to_string):
+        """Test that an identical image is OCR'd once, even under another file name, until the cache is cleared."""
+        clear_ocr_cache()
+        image_copy = os.path.join(self.test_dir, "test_image_copy.png")
+        with open(self.image_path, "rb") as src, open(image_copy, "wb") as dst:
+            dst.write(src.read())
+        try:
+            for path in (self.image_path, self.image_path, image_copy):
+                self.assertEqual(extract_text_from_document(path), "Cached OCR Text")
+            self.assertEqual(mock_image_to_string.call_count, 1)
+
+            clear_ocr_cache()
+            extract_text_from_document(self.image_path)
+            self.assertEqual(mock_image_to_string.call_count, 2)
+        finally:
+            os.remove(image_copy)
+            clear_ocr_cache()
+
+    @patch('core.ocr_engine._OCR_CACHE_SIZE', 1)
+    @patch('core.ocr_engine.pytesseract.image_to_string', return_value="Cached OCR Text")
+    def test_image_ocr_cache_bounded(self, mock_image_to_string):
+        """Test that the OCR cache evicts the least recently used image beyond its size."""
+        clear_ocr_cache()
+        other_image = os.path.join(self.test_dir, "test_image_other.png")
+        Image.new('RGB', (40, 20), color=(255, 255, 255)).save(other_image)
+        try:
+            for path in (self.image_path, other_image, self.image_path): # The second image evicts the first
+                extract_text_from_document(path)
+            self.assertEqual(mock_image_to_string.call_count, 3)
+        finally:
+            os.remove(other_image)
+            clear_ocr_cache()
+
+    def test_render_page_dpi(self):
+        """Test that standard pages are rendered for OCR at the full RENDER_DPI and oversized ones are capped."""
+        cases = {
+            # name: (page size in points, expected DPI)
+            "a4": ((595, 842), RENDER_DPI),
+            "letter": ((612, 792), RENDER_DPI),
+            "a3": ((842, 1191), 212), # Long edge capped at MAX_RENDER_EDGE
+        }
+        with fitz.open() as doc:
+            for name, ((width, height), expected_dpi) in cases.items():
+                with self.subTest(case=name):
+                    png_bytes = _render_page(doc.new_page(width=width, height=height))
+                    image = Image.open(io.BytesIO(png_bytes))
+                    self.assertEqual(round(image.info["dpi"][0]), expected_dpi)
+                    self.assertEqual(image.mode, "L")
+
+    @unittest.skipUnless(cv2, "OpenCV is not installed")
+    def test_preprocess_deskews_page(self):
+        """Test that preprocessing binarizes a skewed scan and rotates its text line back to horizontal."""
+        page = Image.new('L', (800, 600), 235) # Light grey paper
+        ImageDraw.Draw(page).rectangle((100, 290, 700, 310), fill=30) # One dark horizontal "text line"
+        skewed = page.rotate(6, resample=Image.BICUBIC, fillcolor=235)
+
+        def dark_rows(image):
+            return int((np.asarray(image) < 128).any(axis=1).sum())
+
+        processed = _preprocess_for_ocr(skewed)
+        self.assertEqual(processed.size, skewed.size)
+        self.assertTrue(set(np.unique(np.asarray(processed))) <= {0, 255})
+        self.assertLess(dark_rows(processed), dark_rows(skewed) / 2)
+
+    def test_ocr_pool_start_method(self):
+        """Test that OCR workers use a fork server where available and spawn elsewhere (e.g. Windows)."""
+        cases = {
+            "forkserver_available": (["fork", "spawn", "forkserver"], "forkserver"),
+            "no_forkserver": (["spawn"], "spawn"),
+        }
+        for name, (methods, expected) in cases.items():
+            with self.subTest(case=name):
+                with patch('core.ocr_engine.multiprocessing.get_all_start_methods', return_value=methods):
+                    self.assertEqual(_ocr_mp_context().get_start_method(), expected)
+
+    def test_ocr_pool_reused(self):
+        """Test that every document shares one OCR process pool."""
+        self.assertIs(_ocr_executor(), _ocr_executor())
+
     def test_unsupported_file_type(self):
         """Test handling of unsupported file types."""
+        # The file type is decided from the extension alone, so the file need not exist
         unsupported_file = os.path.join(self.test_dir, "test.txt")
-        with open(unsupported_file, "w") as f:
-            f.write("This is a text file.")
-        
         with self.assertRaises(ValueError) as cm:
             extract_text_from_document(unsupported_file)
         self.assertIn("Unsupported file type", str(cm.exception))
-        os.remove(unsupported_file)
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,13 +1,52 @@
 import unittest
 import os
-import json
-from datetime import datetime
+import shutil
 from unittest.mock import patch, MagicMock
-
-# Assuming core.pdf_generator is in the parent directory or correctly in PYTHONPATH
-import sys
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from core.pdf_generator import create_pdf_summary_weasyprint
+from types import MappingProxyType
+import base64
+from concurrent.futures import ThreadPoolExecutor
+
+from core.pdf_generator import create_pdf_summary_weasyprint, _render_body
+
+# A 100x50 light blue (200, 200, 255) PNG, precomputed so the logo fixture is written
+# without running Pillow's PNG encoder
+_DUMMY_LOGO_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAGQAAAAyCAIAAAAlV+npAAAAXklEQVR42u3QgQAAAAgDsMof7FalEMCGsE62+BkFsmTJkiVLlgJZ"
+    "smTJkiVLgSxZsmTJkqVAlixZsmTJUiBLlixZsmQpkCVLlixZshTIkiVLlixZCmTJkiVLliwFfwclPQLzyhKrKAAAAABJRU5ErkJggg=="
+)
+
+# Sample extraction results, built once at import and shared read-only by every test
+SAMPLE_INVOICE_DATA = MappingProxyType({
+    "invoice_number": "INV-12345",
+    "date": "2024-07-15",
+    "vendor_name": "TestCorp",
+    "customer_name": "ClientCo",
+    "total_amount": "150.75",
+    "currency": "USD",
+    "items": [
+        {"description": "Item A", "quantity": 2, "unit_price": "25.00", "line_total": "50.00"},
+        {"description": "Item B", "quantity": 1, "unit_price": "100.75", "line_total": "100.75"}
+    ],
+    "payment_terms": "Net 30",
+    "summary": "This invoice from TestCorp to ClientCo is for items A and B, totaling $150.75 USD."
+})
+
+SAMPLE_CONTRACT_DATA = MappingProxyType({
+    "contract_title": "Consulting Agreement",
+    "parties": ["Consultant X", "Company Y"],
+    "effective_date": "2024-01-01",
+    "termination_date": "2024-12-31",
+    "governing_law": "California",
+    "key_clauses_summary": "Defines scope of consulting, payment schedule, and confidentiality.",
+    "overall_summary": "A one-year consulting agreement between Consultant X and Company Y for advisory services."
+})
+
+SAMPLE_GENERAL_DATA = MappingProxyType({
+    "document_main_topic": "Project Overview",
+    "key_entities": ["Phase 1", "Budget", "Timeline"],
+    "main_points": ["Phase 1 completed on time.", "Budget allocated.", "Next steps defined."],
+    "overall_summary": "This document provides an overview of the project, detailing the completion of Phase 1, budget allocation, and future plans."
+})
 
 class TestPDFGenerator(unittest.TestCase):
 
@@ -19,123 +58,80 @@ class TestPDFGenerator(unittest.TestCase):
 
         # Dummy logo file
         cls.dummy_logo_path = os.path.join(cls.test_output_dir, "dummy_logo.png")
-        try:
-            from PIL import Image
-            img = Image.new('RGB', (100, 50), color = (200, 200, 255)) # Light blue
-            img.save(cls.dummy_logo_path)
-        except ImportError:
-            cls.dummy_logo_path = None # Cannot create dummy logo without Pillow
-
-        cls.sample_invoice_data = {
-            "invoice_number": "INV-12345",
-            "date": "2024-07-15",
-            "vendor_name": "TestCorp",
-            "customer_name": "ClientCo",
-            "total_amount": "150.75",
-            "currency": "USD",
-            "items": [
-                {"description": "Item A", "quantity": 2, "unit_price": "25.00", "line_total": "50.00"},
-                {"description": "Item B", "quantity": 1, "unit_price": "100.75", "line_total": "100.75"}
-            ],
-            "payment_terms": "Net 30",
-            "summary": "This invoice from TestCorp to ClientCo is for items A and B, totaling $150.75 USD."
-        }
-
-        cls.sample_contract_data = {
-            "contract_title": "Consulting Agreement",
-            "parties": ["Consultant X", "Company Y"],
-            "effective_date": "2024-01-01",
-            "termination_date": "2024-12-31",
-            "governing_law": "California",
-            "key_clauses_summary": "Defines scope of consulting, payment schedule, and confidentiality.",
-            "overall_summary": "A one-year consulting agreement between Consultant X and Company Y for advisory services."
-        }
-        
-        cls.sample_general_data = {
-            "document_main_topic": "Project Overview",
-            "key_entities": ["Phase 1", "Budget", "Timeline"],
-            "main_points": ["Phase 1 completed on time.", "Budget allocated.", "Next steps defined."],
-            "overall_summary": "This document provides an overview of the project, detailing the completion of Phase 1, budget allocation, and future plans."
-        }
+        with open(cls.dummy_logo_path, "wb") as f:
+            f.write(_DUMMY_LOGO_PNG)
 
+        cls.sample_invoice_data = SAMPLE_INVOICE_DATA
+        cls.sample_contract_data = SAMPLE_CONTRACT_DATA
+        cls.sample_general_data = SAMPLE_GENERAL_DATA
 
     @classmethod
     def tearDownClass(cls):
         """Clean up dummy files after testing."""
-        if os.path.exists(cls.dummy_logo_path):
-            os.remove(cls.dummy_logo_path)
-        if os.path.exists(cls.test_output_dir):
-            # Remove any generated PDFs during tests
-            for f in os.listdir(cls.test_output_dir):
-                os.remove(os.path.join(cls.test_output_dir, f))
-            os.rmdir(cls.test_output_dir)
-
-    @patch('weasyprint.HTML.write_pdf')
-    def test_pdf_generation_invoice(self, mock_write_pdf):
-        """Test PDF generation for invoice data."""
-        mock_write_pdf.return_value = b"dummy_pdf_content_invoice"
-
-        pdf_bytes = create_pdf_summary_weasyprint(
-            self.sample_invoice_data,
-            doc_type="Invoice",
-            logo_path=self.dummy_logo_path
-        )
-        self.assertEqual(pdf_bytes, b"dummy_pdf_content_invoice")
-        mock_write_pdf.assert_called_once()
-        # You could further inspect the HTML string passed to HTML() if needed
-        # For this test, we verify the function call and return value.
-
-    @patch('weasyprint.HTML.write_pdf')
-    def test_pdf_generation_contract(self, mock_write_pdf):
-        """Test PDF generation for contract data."""
-        mock_write_pdf.return_value = b"dummy_pdf_content_contract"
-
-        pdf_bytes = create_pdf_summary_weasyprint(
-            self.sample_contract_data,
-            doc_type="Contract",
-            logo_path=self.dummy_logo_path
-        )
-        self.assertEqual(pdf_bytes, b"dummy_pdf_content_contract")
-        mock_write_pdf.assert_called_once()
-
-    @patch('weasyprint.HTML.write_pdf')
-    def test_pdf_generation_general_doc(self, mock_write_pdf):
-        """Test PDF generation for general document data."""
-        mock_write_pdf.return_value = b"dummy_pdf_content_general"
-
-        pdf_bytes = create_pdf_summary_weasyprint(
-            self.sample_general_data,
-            doc_type="Document",
-            logo_path=self.dummy_logo_path
-        )
-        self.assertEqual(pdf_bytes, b"dummy_pdf_content_general")
-        mock_write_pdf.assert_called_once()
-
-    @patch('weasyprint.HTML.write_pdf')
-    def test_pdf_generation_no_logo(self, mock_write_pdf):
-        """Test PDF generation when no logo path is provided."""
-        mock_write_pdf.return_value = b"dummy_pdf_content_no_logo"
-
-        pdf_bytes = create_pdf_summary_weasyprint(
-            self.sample_invoice_data,
-            doc_type="Invoice",
-            logo_path=None
-        )
-        self.assertEqual(pdf_bytes, b"dummy_pdf_content_no_logo")
-        mock_write_pdf.assert_called_once()
-
-    @patch('weasyprint.HTML.write_pdf')
-    def test_pdf_generation_invalid_logo_path(self, mock_write_pdf):
-        """Test PDF generation with an invalid logo path (should proceed without logo)."""
-        mock_write_pdf.return_value = b"dummy_pdf_content_invalid_logo"
-
-        pdf_bytes = create_pdf_summary_weasyprint(
-            self.sample_invoice_data,
-            doc_type="Invoice",
-            logo_path="/path/to/nonexistent/logo.png"
-        )
-        self.assertEqual(pdf_bytes, b"dummy_pdf_content_invalid_logo")
-        mock_write_pdf.assert_called_once()
+        # Removes the dummy logo together with any PDFs generated during tests
+        shutil.rmtree(cls.test_output_dir, ignore_errors=True)
+
+    # Each HTML object "renders" to its own markup, so every concurrently rendered case carries the HTML
+    # it was built from, whatever order the worker threads call HTML in. The mocks are built without a
+    # spec, so patching never introspects WeasyPrint's HTML class.
+    @patch('core.pdf_generator.HTML', side_effect=lambda string, **kwargs: MagicMock(
+        write_pdf=MagicMock(return_value=string.encode())))
+    def test_pdf_generation(self, mock_html):
+        """Test the HTML rendered for each document type and logo variant, rendering the cases concurrently."""
+        # HTML itself is mocked so WeasyPrint never parses the generated markup
+        cases = {
+            # name: (data, doc_type, logo_path, logo expected, line-item table expected)
+            "invoice": (self.sample_invoice_data, "Invoice", self.dummy_logo_path, True, True),
+            "contract": (self.sample_contract_data, "Contract", self.dummy_logo_path, True, False),
+            "general_doc": (self.sample_general_data, "Document", self.dummy_logo_path, True, False),
+            "no_logo": (self.sample_invoice_data, "Invoice", None, False, True),
+            "invalid_logo_path": (self.sample_invoice_data, "Invoice", "/path/to/nonexistent/logo.png", False, True),
+        }
+
+        with ThreadPoolExecutor() as executor:
+            futures = {
+                name: executor.submit(create_pdf_summary_weasyprint, data, doc_type=doc_type, logo_path=logo_path)
+                for name, (data, doc_type, logo_path, _, _) in cases.items()
+            }
+
+        for name, (data, doc_type, logo_path, has_logo, has_items) in cases.items():
+            with self.subTest(case=name):
+                html_content = futures[name].result().decode()
+                self.assertIn(f"{doc_type} Analysis Report", html_content)
+                self.assertEqual("data:image/png;base64," in html_content, has_logo)
+                self.assertEqual('<table class="item-table">' in html_content, has_items)
+        self.assertEqual(mock_html.call_count, len(cases))
+
+    @patch('core.pdf_generator.HTML')
+    def test_pdf_generation_escapes_values(self, mock_html):
+        """Test that extracted text is HTML-escaped in the title, fields, line items and summary."""
+        data = {
+            "vendor_name": "Smith & Sons <Ltd>",
+            "items": [{"description": "<b>Bold</b> item", "line_total": "5 & 6"}],
+            "summary": "Total < limit & approved",
+        }
+        create_pdf_summary_weasyprint(data, doc_type="<Invoice>")
+        html_content = mock_html.call_args.kwargs["string"]
+
+        self.assertIn("&lt;invoice&gt; Analysis Report", html_content)
+        self.assertIn("Smith &amp; Sons &lt;Ltd&gt;", html_content)
+        self.assertIn("&lt;b&gt;Bold&lt;/b&gt; item", html_content)
+        self.assertIn("5 &amp; 6", html_content)
+        self.assertIn("Total &lt; limit &amp; approved", html_content)
+        self.assertNotIn("<Ltd>", html_content)
+        self.assertNotIn("<b>", html_content)
+
+    @patch('core.pdf_generator.HTML')
+    def test_pdf_generation_caches_body(self, mock_html):
+        """Test that re-rendering identical data reuses the cached body, with a fresh footer each time."""
+        _render_body.cache_clear()
+        for _ in range(2):
+            create_pdf_summary_weasyprint(dict(self.sample_contract_data), doc_type="Contract")
+        self.assertEqual(_render_body.cache_info().hits, 1)
+        first, second = (call.kwargs["string"] for call in mock_html.call_args_list)
+        self.assertIn("Generated on:", second)
+        self.assertEqual(first.split("Generated on:")[0], second.split("Generated on:")[0])
+        _render_body.cache_clear()
 
 
 if __name__ == '__main__':